@@ -0,0 +1,44 @@
+#!/usr/bin/env bash
+# Copyright 2020 Red Hat, Inc. jcope@redhat.com
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Builds a local mirror of the stub openshift-install and oc binaries (hack/stubs) for the given versions, to run the
+# runner end to end without AWS or a real mirror:
+#
+#   hack/stub-mirror.sh /tmp/caliper-mirror 4.6.1 4.6.2 4.6.3
+#   export CALIPER_OCP_MIRROR=file:///tmp/caliper-mirror PATH=$PWD/hack/stubs:$PATH
+#   (or serve it, e.g. python -m http.server -d /tmp/caliper-mirror, and use its http:// URL)
+#   export CALIPER_CLUSTER_STABLE_SECONDS=0 CALIPER_CLUSTER_POLL_SECONDS=1 CALIPER_TEST_RANGE_SECONDS=0
+#   python runner/main.py --versions 4.6.1..4.6.3 --install-config hack/stubs/install-config.yaml -d /tmp/caliper-runs
+set -euo pipefail
+
+mirror=$(realpath "$1")
+shift
+stubs=$(cd "$(dirname "$0")/stubs" && pwd)
+platform=linux
+sha256sum=sha256sum
+if [ "$(uname)" = Darwin ]; then
+  platform=mac
+  sha256sum='shasum -a 256'
+fi
+
+for version in "$@"; do
+  suffix="-$version"
+  [ "$version" = latest ] && suffix=''
+  mkdir -p "$mirror/$version"
+  tar -czf "$mirror/$version/openshift-install-$platform$suffix.tar.gz" -C "$stubs" openshift-install
+  tar -czf "$mirror/$version/openshift-client-$platform$suffix.tar.gz" -C "$stubs" oc
+  (cd "$mirror/$version" && $sha256sum ./*.tar.gz | sed 's| \./| |' >sha256sum.txt)
+done
+echo "export CALIPER_OCP_MIRROR=file://$mirror"
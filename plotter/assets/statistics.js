@@ -0,0 +1,26 @@
+// Rebuilds a chart's figure for the selected statistic from the payload stored by its server callback, see
+// statistics_payload() in main.py.  Runs in the browser, so switching statistics never makes a request.
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    caliper: {
+        select_statistic: function (op, payload) {
+            if (!payload || !payload.figure) {
+                return window.dash_clientside.no_update;
+            }
+            const base = payload.figure;
+            const statistic = payload.statistics[op];
+            if (!statistic) {
+                return base;
+            }
+            const baseTraces = {};
+            base.data.forEach(function (trace) {
+                baseTraces[trace.name] = trace;
+            });
+            return {
+                data: statistic.traces.map(function (entry) {
+                    return Object.assign({}, baseTraces[entry[0]] || {}, entry[1]);
+                }),
+                layout: Object.assign({}, base.layout, statistic.layout),
+            };
+        },
+    },
+});
@@ -0,0 +1,115 @@
+"""
+Compares the COPY based loader.read_frame against the original fetchall() executeQuery path.
+
+Each path runs in a fresh process so peak RSS is not polluted by the other. Connection settings are read from the
+plotter's .env file / PG* environment variables.
+
+    python benchmarks/bench_loader.py --metric container_memory_bytes --repeat 3
+"""
+import argparse
+import importlib
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+import tracemalloc
+
+from processes import wait_for
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), os.path.pardir))
+
+value_columns = ['q95_value', 'avg_value', 'min_value', 'max_value']
+
+
+def connect():
+    import psycopg2
+    from dotenv import load_dotenv
+    load_dotenv()
+    return psycopg2.connect(
+        host=os.getenv('PGHOST'),
+        port=os.getenv('PGPORT'),
+        database=os.getenv('PGDATABASE'),
+        user=os.getenv('PGUSER'),
+        password=os.getenv('PGPASSWORD')
+    )
+
+
+def legacy_execute_query(conn, query, params):
+    # executeQuery and db_numeric_to_float as they were before loader.read_frame
+    import pandas as pd
+    cur = conn.cursor()
+    cur.execute(query, params)
+    desc = cur.description
+    columns = [col[0] for col in desc]
+    rows = [row for row in cur.fetchall()]
+    df = pd.DataFrame([[c for c in r] for r in rows])
+    df.rename(inplace=True, columns=dict(enumerate(columns)))
+    for v in value_columns:
+        df[v] = df[v].astype('float')
+    return df
+
+
+def copy_execute_query(conn, query, params):
+    import loader
+    return loader.read_frame(conn, query, params)
+
+
+paths = {
+    'fetchall': legacy_execute_query,
+    'copy': copy_execute_query,
+}
+
+
+def measure(path, query, params, results):
+    conn = connect()
+    # both paths import lazily, so load their modules first to keep import time out of the measurement
+    importlib.import_module('pandas')
+    importlib.import_module('loader')
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    tracemalloc.start()
+    start = time.perf_counter()
+    df = paths[path](conn, query, params)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    results.put({
+        'path': path,
+        'rows': len(df),
+        'seconds': elapsed,
+        'peak_traced_bytes': peak,
+        'peak_rss_growth_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before,
+        'frame_bytes': int(df.memory_usage(deep=True).sum()),
+    })
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--metric', type=str, default='container_memory_bytes', help='metric to load')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per path')
+    parser.add_argument('--path', type=str, action='append', choices=list(paths), help='limit to these paths')
+    parser.add_argument('--timeout', type=float, default=600.0, help='seconds before a run is killed')
+    args = parser.parse_args()
+
+    query = 'SELECT * FROM caliper_metrics WHERE metric = %s;'
+    ctx = multiprocessing.get_context('spawn')
+    results = ctx.Queue()
+    failed = False
+    for path in args.path or list(paths):
+        for i in range(args.repeat):
+            p = ctx.Process(target=measure, args=(path, query, (args.metric,), results))
+            p.start()
+            result = wait_for(p, results, args.timeout)
+            p.join()
+            if result is None:
+                result = {'path': path, 'error': 'no result', 'exitcode': p.exitcode}
+                failed = True
+            result['run'] = i
+            print(json.dumps(result))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
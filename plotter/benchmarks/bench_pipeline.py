@@ -0,0 +1,188 @@
+"""
+Times each stage of the plotter's data path on synthetic data (see synthetic.py), at one or more scales.
+
+Stages are timed separately, each on the output of the one before: loading the raw rows (loader.read_frame),
+db_numeric_to_float, assign_groupings, version indexing, summarizing by each grouping key, the largest group's
+drill-down, the regression matrix and table, loading the rollup, the per chart frame preparation, building each kind
+of figure and serializing it, and finally every chart's callback payload from cold caches.  Wall times are the
+min/median of --repeat runs; peak memory is the peak traced by tracemalloc over one extra run.
+
+By default the database is an in-process stand-in (standin.py), so nothing but the plotter itself is measured; the
+rollup is then precomputed and its stage measures only the read.  With --db postgres the rows are COPYed into the
+PG* database's caliper_metrics, which must be empty (or --replace), and the rollup stage includes its refresh.
+
+    python benchmarks/bench_pipeline.py --versions 19,100,500 --output report.json
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+benchmarks_dir = os.path.dirname(os.path.realpath(__file__))
+plotter_dir = os.path.join(benchmarks_dir, os.path.pardir)
+sys.path.insert(0, plotter_dir)
+
+import synthetic  # noqa: E402
+
+
+def measure(name, fn, setup=None, repeat=3):
+    # setup() builds fn's argument outside of the timing, so stages that modify their input get a fresh one each run
+    seconds = []
+    result = None
+    for _ in range(repeat):
+        args = (setup(),) if setup else ()
+        start = time.perf_counter()
+        result = fn(*args)
+        seconds.append(time.perf_counter() - start)
+    args = (setup(),) if setup else ()
+    tracemalloc.start()
+    fn(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, {
+        'stage': name,
+        'seconds_min': min(seconds),
+        'seconds_median': statistics.median(seconds),
+        'peak_traced_bytes': peak,
+    }
+
+
+def frame_bytes(df):
+    return int(df.memory_usage(deep=True).sum())
+
+
+def run_scale(main, args, versions, install):
+    df = synthetic.generate(versions, args.namespaces, args.pods, args.nodes, args.seed)
+    install(df)
+    main.known_generations.clear()
+    main.frames.invalidate()
+    main.figures.invalidate()
+
+    import loader
+    metric = args.metric
+    op = 'q95_value'
+    stages = []
+
+    def stage(name, fn, setup=None):
+        result, report = measure(name, fn, setup, args.repeat)
+        stages.append(report)
+        return result
+
+    query, params = main.metrics_query(metric)
+    raw = stage('execute_query', lambda: main.db.run(lambda conn: loader.read_frame(conn, query, params)))
+    typed = stage('db_numeric_to_float', main.db_numeric_to_float, lambda: raw.copy())
+    stage('assign_groupings', main.assign_groupings, lambda: typed.copy())
+    indexed = stage('index_versions', main.versions.index_versions, lambda: typed.copy())
+    for by in [('version', 'group'), ('namespace',), ('pod',), ('node',)]:
+        stage(f'summarize[{",".join(by)}]', lambda: main.aggregation.summarize(indexed, by))
+    largest = indexed['group'].value_counts().idxmax()
+    usage = stage('drilldown_usage', lambda: main.drilldown.Usage(indexed[indexed['group'] == largest], op,
+                                                                  main.versions.ordered(indexed)))
+    stage('drilldown_fig', lambda: main.drilldown_fig(usage, 1, main.drilldown_page_size).to_json())
+    by = ['version'] + main.regression.keys
+    matrix = stage('regression_matrix', lambda: main.regression.Matrix(main.aggregation.summarize(indexed, by),
+                                                                       main.versions.ordered(indexed)))
+    stage('regression_table', lambda: main.regression.largest(matrix, op, limit=main.regression_rows))
+
+    generation = main.data_generation(metric)
+    stage('load_rollup', lambda: main.load_rollup(metric, generation))
+    rolled = main.get_rollup(metric)
+
+    sums = stage('group_sums', main.group_sums, lambda: rolled)
+    stage('get_max_bar_height', main.get_max_bar_height, lambda: sums)
+    trimmed = stage('trim_and_group', lambda df: main.trim_and_group(df, op), lambda: sums)
+    y_max = main.pad_range(main.get_max_bar_height(sums))
+
+    figures = {
+        'bar_fig': stage('bar_fig', lambda: main.bar_fig(trimmed, op, y_max)),
+        'line_fig': stage('line_fig', lambda: main.line_fig(trimmed, op, y_max)),
+        'bar_group_fig': stage('bar_group_fig', lambda: main.bar_group_fig(main.group_maxima(rolled), op, y_max)),
+    }
+    for name, fig in figures.items():
+        stage(f'{name}.to_json', fig.to_json)
+
+    def cold_callbacks():
+        main.known_generations.clear()
+        main.frames.invalidate()
+        main.figures.invalidate()
+        for chart_id in main.charts:
+            main.render_statistics(chart_id)
+
+    stage('callbacks_cold', cold_callbacks)
+
+    return {
+        'versions': versions,
+        'namespaces': args.namespaces,
+        'pods_per_namespace': args.pods,
+        'nodes': args.nodes,
+        'rows': len(df),
+        'metric_rows': len(raw),
+        'raw_frame_bytes': frame_bytes(indexed),
+        'rollup_rows': len(rolled),
+        'rollup_frame_bytes': frame_bytes(rolled),
+        'stages': stages,
+    }
+
+
+def set_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--versions', type=str, default='19', help='comma separated numbers of versions to run')
+    parser.add_argument('--namespaces', type=int, default=43, help='namespaces per version')
+    parser.add_argument('--pods', type=int, default=4, help='pods per namespace')
+    parser.add_argument('--nodes', type=int, default=6, help='nodes per cluster')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--metric', type=str, default='container_memory_bytes', choices=list(synthetic.shapes))
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per stage')
+    parser.add_argument('--db', type=str, default='standin', choices=['standin', 'postgres'])
+    parser.add_argument('--replace', action='store_true', help='with --db postgres, truncate caliper_metrics first')
+    parser.add_argument('--float32', action='store_true', help='run with PLOTTER_FRAME_FLOAT32')
+    parser.add_argument('--output', type=str, help='write the JSON report here instead of stdout')
+    return parser.parse_args()
+
+
+def main():
+    args = set_args()
+    os.chdir(plotter_dir)
+    os.environ['PLOTTER_NOTIFY_CHANNEL'] = ''
+    if args.float32:
+        os.environ['PLOTTER_FRAME_FLOAT32'] = 'true'
+
+    if args.db == 'standin':
+        import standin
+        standin.patch()
+        import main as plotter
+        plotter.init()
+
+        def install(df):
+            standin.dataset.set(df, plotter.group_index.assign, plotter.frame_columns)
+    else:
+        import main as plotter
+        plotter.init()
+
+        loaded = []
+
+        def install(df):
+            # later scales replace the rows loaded for the previous one
+            plotter.db.run(lambda conn: synthetic.load_postgres(conn, df, replace=args.replace or bool(loaded)))
+            loaded.append(len(df))
+
+    report = {
+        'db': args.db,
+        'metric': args.metric,
+        'repeat': args.repeat,
+        'float32': args.float32,
+        'scales': [run_scale(plotter, args, int(v), install) for v in args.versions.split(',')],
+    }
+    out = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(out + '\n')
+    else:
+        print(out)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Measures plotter startup against its budget, each phase in a fresh process with the database stand-in (standin.py).
+
+    import        importing main, which must not connect to anything
+    create_app    building the app, without touching data
+    preload       create_app(preload=True), loading and rendering every chart as a preforking server would
+
+Prints one JSON line per phase and exits non-zero if any phase took longer than --budget seconds, or if importing
+main made a connection.
+
+    python benchmarks/bench_startup.py --versions 300 --budget 10
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+from processes import wait_for
+
+benchmarks_dir = os.path.dirname(os.path.realpath(__file__))
+plotter_dir = os.path.join(benchmarks_dir, os.path.pardir)
+
+
+def measure(phase, versions, results):
+    sys.path[:0] = [plotter_dir, benchmarks_dir]
+    os.chdir(plotter_dir)
+    os.environ['PLOTTER_NOTIFY_CHANNEL'] = ''
+    import standin
+    import synthetic
+    connects = []
+    connect = standin.connect
+    standin.connect = lambda *args, **kwargs: connects.append(1) or connect()
+    standin.patch()
+    from groupings import GroupIndex
+
+    start = time.perf_counter()
+    import main
+    imported = time.perf_counter()
+    result = {'phase': phase, 'seconds': imported - start, 'connections_on_import': len(connects)}
+    if phase != 'import':
+        standin.dataset.set(synthetic.generate(versions), GroupIndex('component-mappings.yaml').assign,
+                            main.frame_columns)
+        start = time.perf_counter()
+        main.create_app(preload=phase == 'preload', listen=False)
+        result['seconds'] = time.perf_counter() - start
+    results.put(result)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--versions', type=int, default=19, help='versions of synthetic data to preload')
+    parser.add_argument('--budget', type=float, default=10.0, help='max seconds for any phase')
+    parser.add_argument('--timeout', type=float, default=600.0, help='seconds before a phase is killed')
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context('spawn')
+    results = ctx.Queue()
+    failed = False
+    for phase in ['import', 'create_app', 'preload']:
+        p = ctx.Process(target=measure, args=(phase, args.versions, results))
+        p.start()
+        result = wait_for(p, results, args.timeout)
+        p.join()
+        if result is None:
+            print(json.dumps({'phase': phase, 'error': 'no result', 'exitcode': p.exitcode}))
+            failed = True
+            continue
+        result['budget'] = args.budget
+        result['within_budget'] = result['seconds'] <= args.budget and not result['connections_on_import']
+        failed = failed or not result['within_budget']
+        print(json.dumps(result))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,23 @@
+"""
+Helpers for the benchmarks that measure each run in a fresh process.
+"""
+import queue
+import time
+
+
+def wait_for(p, results, timeout=600.0):
+    # the child's result, or None if it exits without one (e.g. crashed) or outlives timeout, when it's killed
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return results.get(timeout=1)
+        except queue.Empty:
+            if not p.is_alive():
+                # its result may have been flushed just as it exited
+                try:
+                    return results.get(timeout=1)
+                except queue.Empty:
+                    return None
+            if time.monotonic() > deadline:
+                p.terminate()
+                return None
@@ -0,0 +1,181 @@
+"""
+In-process stand-in for the few postgres statements the plotter issues, serving rows from a synthetic frame.
+
+Enough of psycopg2's connection/cursor interface for db.Database, loader.read_frame and rollup to run unchanged, so
+the plotter's own pandas and plotly stages can be benchmarked without a database.  Install it with patch() before
+importing main.  The rollup is computed in pandas when the dataset is set, so rollup reads measure only the transfer
+into a frame; use a real database to measure the refresh itself.
+"""
+import datetime
+import re
+from collections import namedtuple
+
+import pandas as pd
+import psycopg2
+
+import synthetic
+
+Column = namedtuple('Column', ['name', 'type_code'])
+
+# type oids of caliper_metrics' and the rollup view's columns, see loader._*_oids
+_raw_types = dict(
+    [(c, 25) for c in ['version', 'metric', 'node', 'pod', 'namespace', 'owner_name', 'range']] +
+    [(c, 1700) for c in ['avg_value', 'q95_value', 'max_value', 'min_value', 'inst_value']] +
+    [('query_time', 1114)]
+)
+_value_columns = ['q95_value', 'avg_value', 'min_value', 'max_value']
+
+_metric_param = re.compile(r"metric = '([^']*)'")
+_select_list = re.compile(r'SELECT ([^()]*?) FROM caliper_metrics')
+
+
+def _selected(query=''):
+    # the caliper_metrics columns a query selects
+    found = _select_list.search(query)
+    if not found or found.group(1).strip() == '*':
+        return tuple(synthetic.columns)
+    return tuple(c.strip() for c in found.group(1).split(','))
+
+
+class Dataset:
+    """
+    The rows served by every stand-in connection, per metric: raw rows as COPY would stream them, and the rollup.
+    """
+
+    def __init__(self):
+        self.raw = {}
+        self.csv = {}
+        self.rollup = {}
+
+    def set(self, df=pd.DataFrame(), group=None, select=None):
+        # group(namespaces) -> group names, like groupings.GroupIndex.assign. The CSV of the select columns is
+        # rendered up front, any other selection on first use.
+        self.raw, self.csv, self.rollup = {}, {}, {}
+        for metric, rows in df.groupby('metric', sort=False):
+            self.raw[metric] = rows
+            self.rollup[metric] = rollup_frame(rows, group)
+            self.copy(metric, tuple(select or synthetic.columns))
+
+    def copy(self, metric='', select=()) -> bytes:
+        key = (metric, select)
+        if key not in self.csv:
+            rows = self.raw.get(metric)
+            self.csv[key] = b'' if rows is None else synthetic.to_csv(rows, list(select))
+        return self.csv[key]
+
+
+dataset = Dataset()
+
+
+def rollup_frame(df=pd.DataFrame(), group=None) -> pd.DataFrame:
+    # what sql/rollup.sql computes for one metric
+    df = df.assign(group=pd.Series(group(df['namespace']), index=df.index).astype(str))
+    grouped = df.groupby(['version', 'metric', 'group'], sort=False)
+    out = grouped[_value_columns].sum()
+    for v in _value_columns:
+        out[f'{v}_max'] = grouped[v].max()
+    out['rows'] = grouped.size()
+    out['last_query_time'] = grouped['query_time'].max()
+    return out.reset_index()
+
+
+def _literal(value):
+    if value is None:
+        return 'NULL'
+    if isinstance(value, (int, float)):
+        return str(value)
+    if isinstance(value, datetime.datetime):
+        value = value.isoformat(sep=' ')
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+class Cursor:
+
+    def __init__(self, conn):
+        self.connection = conn
+        self.description = None
+        self._rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._rows = []
+
+    def mogrify(self, query, params=None):
+        if isinstance(query, bytes):
+            query = query.decode()
+        if params:
+            query = query % tuple(_literal(p) for p in params)
+        return query.encode()
+
+    def execute(self, query, params=None):
+        if not isinstance(query, str):
+            query = query.as_string(self) if hasattr(query, 'as_string') else query.decode()
+        query = self.mogrify(query, params).decode()
+        metric = _metric_param.search(query)
+        metric = metric.group(1) if metric else None
+        self.description = None
+        self._rows = []
+        if 'LIMIT 0' in query:
+            self.description = [Column(c, _raw_types[c]) for c in _selected(query)]
+        elif query.startswith('SELECT count(*), max(query_time)'):
+            rows = dataset.raw.get(metric, pd.DataFrame(columns=['query_time']))
+            self._rows = [(len(rows), rows['query_time'].max() if len(rows) else None)]
+        elif query.startswith('SELECT max(query_time)'):
+            rows = dataset.raw.get(metric, pd.DataFrame(columns=['query_time']))
+            self._rows = [(rows['query_time'].max() if len(rows) else None,)]
+        elif query.startswith('SELECT sum(rows)'):
+            rows = dataset.rollup.get(metric)
+            self._rows = [(None, None) if rows is None else (int(rows['rows'].sum()), rows['last_query_time'].max())]
+        elif query.startswith('SELECT * FROM caliper_group_rollup'):
+            rows = dataset.rollup.get(metric, pd.DataFrame())
+            self.description = [Column(c, None) for c in rows.columns]
+            self._rows = list(rows.itertuples(index=False, name=None))
+        elif query.startswith('SELECT 1'):
+            self._rows = [(1,)]
+        # anything else is DDL, group table maintenance or a refresh: nothing to do
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+    def fetchall(self):
+        return self._rows
+
+    def copy_expert(self, sql, file, size=8192):
+        metric = _metric_param.search(sql)
+        data = dataset.copy(metric.group(1) if metric else None, _selected(sql))
+        for i in range(0, len(data), size):
+            file.write(data[i:i + size])
+
+
+class Connection:
+    encoding = 'UTF8'
+
+    def __init__(self):
+        self.closed = 0
+        self.autocommit = False
+        self.notifies = []
+
+    def cursor(self, name=None):
+        return Cursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+
+def connect(*args, **kwargs):
+    return Connection()
+
+
+def patch():
+    psycopg2.connect = connect
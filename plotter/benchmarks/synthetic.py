@@ -0,0 +1,165 @@
+"""
+Synthetic caliper_metrics rows for benchmarking the plotter.
+
+Value distributions, pods per namespace and nodes per cluster follow example/database.psql (19 versions, 43
+namespaces, ~163 pods and 6 nodes per version and metric); the number of versions, namespaces, pods and nodes can be
+scaled independently. Each pod keeps a base usage across versions with a small per-version drift, so the data has
+trends to chart.
+
+    python benchmarks/synthetic.py --versions 300 --output metrics.csv
+    python benchmarks/synthetic.py --versions 300 --postgres  # COPY into the PG* database's caliper_metrics
+"""
+import argparse
+import datetime
+import io
+import os
+import sys
+
+import numpy
+import pandas as pd
+import yaml
+
+plotter_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), os.path.pardir)
+sys.path.insert(0, plotter_dir)
+
+import drilldown  # noqa: E402
+
+# column order of prom-top's dbhandler.ColumnsHeaders()
+columns = ['version', 'metric', 'node', 'pod', 'namespace', 'owner_name', 'avg_value', 'q95_value', 'max_value',
+           'min_value', 'inst_value', 'query_time', 'range']
+
+table_ddl = """
+CREATE TABLE IF NOT EXISTS caliper_metrics
+(
+    version    text NOT NULL,
+    metric     text NOT NULL,
+    node       text NOT NULL,
+    pod        text NOT NULL,
+    namespace  text NOT NULL,
+    owner_name text,
+    avg_value  numeric,
+    q95_value  numeric,
+    max_value  numeric,
+    min_value  numeric,
+    inst_value numeric,
+    query_time timestamp without time zone,
+    range      text NOT NULL
+);
+"""
+
+# median and log-space spread of each pod's avg_value in the example dump
+shapes = {
+    'container_memory_bytes': (3.06e7, 0.64),
+    'cpu_usage_ratio': (1.26e-3, 1.66),
+}
+
+
+def version_names(n=19):
+    # 4.6.0 ... 4.6.29, 4.7.0 ...
+    return [f'4.{6 + i // 30}.{i % 30}' for i in range(n)]
+
+
+def namespace_names(n=43):
+    # the mapped namespaces first, so groupings look like a real cluster's, then unmapped ones
+    with open(os.path.join(plotter_dir, 'component-mappings.yaml'), 'r') as file:
+        config = yaml.load(file, Loader=yaml.FullLoader) or {}
+    names = [ns for namespaces in config.values() for ns in namespaces if '*' not in ns and '?' not in ns]
+    names += [f'openshift-synthetic-{i}' for i in range(max(0, n - len(names)))]
+    return names[:n]
+
+
+def pod_suffix(n=0) -> str:
+    # 5 characters of kubernetes' generated name alphabet, like the random end of a pod's name
+    alphabet = drilldown._alphabet
+    chars = []
+    for _ in range(5):
+        n, d = divmod(n, len(alphabet))
+        chars.append(alphabet[d])
+    return ''.join(chars)
+
+
+def generate(versions=19, namespaces=43, pods=4, nodes=6, seed=0) -> pd.DataFrame:
+    """
+    One row per (version, metric, namespace, pod), pods being spread round robin over the nodes.
+    """
+    rng = numpy.random.default_rng(seed)
+    version_list = version_names(versions)
+    namespace_list = namespace_names(namespaces)
+    start = datetime.datetime(2021, 3, 1)
+    frames = []
+    for metric, (median, sigma) in shapes.items():
+        n_pods = namespaces * pods
+        base = median * numpy.exp(rng.normal(0, sigma, n_pods))
+        for i, version in enumerate(version_list):
+            avg = base * numpy.exp(rng.normal(0.002 * i, 0.05, n_pods))
+            q95 = avg * rng.uniform(1.2, 2.5, n_pods)
+            peak = q95 * rng.uniform(1.0, 1.3, n_pods)
+            pod_ids = numpy.arange(n_pods)
+            frames.append(pd.DataFrame({
+                'version': version,
+                'metric': metric,
+                'node': [f'ip-10-0-{i % 256}-{n}.compute.internal' for n in pod_ids % nodes],
+                # two replicas per workload, with a random looking suffix like a deployment's pods
+                'pod': [f'workload-{p // 2}-{pod_suffix(p * 7919 + i * 104729)}' for p in pod_ids],
+                'namespace': [namespace_list[p // pods] for p in pod_ids],
+                'owner_name': [f'owner-{p // 2}' for p in pod_ids],
+                'avg_value': avg,
+                'q95_value': q95,
+                'max_value': peak,
+                'min_value': avg * rng.uniform(0.0, 0.3, n_pods),
+                'inst_value': peak,
+                'query_time': start + datetime.timedelta(hours=i),
+                'range': '10m',
+            }, columns=columns))
+    return pd.concat(frames, ignore_index=True)
+
+
+def to_csv(df=pd.DataFrame(), select=None) -> bytes:
+    # the CSV postgres would COPY out for these rows, optionally only the select columns
+    buf = io.StringIO()
+    df.to_csv(buf, columns=select or columns, header=False, index=False, date_format='%Y-%m-%d %H:%M:%S')
+    return buf.getvalue().encode()
+
+
+def load_postgres(conn, df=pd.DataFrame(), replace=False):
+    with conn.cursor() as cur:
+        cur.execute(table_ddl)
+        cur.execute('SELECT count(*) FROM caliper_metrics;')
+        existing = cur.fetchone()[0]
+        if existing and not replace:
+            raise RuntimeError(f'caliper_metrics already has {existing} rows, use a scratch database or --replace')
+        cur.execute('TRUNCATE caliper_metrics;')
+        cur.copy_expert(f'COPY caliper_metrics ({", ".join(columns)}) FROM STDIN WITH (FORMAT csv)',
+                        io.BytesIO(to_csv(df)))
+    conn.commit()
+
+
+def set_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--versions', type=int, default=19, help='number of versions')
+    parser.add_argument('--namespaces', type=int, default=43, help='namespaces per version')
+    parser.add_argument('--pods', type=int, default=4, help='pods per namespace')
+    parser.add_argument('--nodes', type=int, default=6, help='nodes per cluster')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', type=str, help='write rows as CSV to this file')
+    parser.add_argument('--postgres', action='store_true', help='load rows into the PG* database')
+    parser.add_argument('--replace', action='store_true', help='truncate a non-empty caliper_metrics first')
+    return parser.parse_args()
+
+
+def main():
+    args = set_args()
+    df = generate(args.versions, args.namespaces, args.pods, args.nodes, args.seed)
+    if args.output:
+        with open(args.output, 'wb') as file:
+            file.write(to_csv(df))
+    if args.postgres:
+        from bench_loader import connect
+        conn = connect()
+        load_postgres(conn, df, replace=args.replace)
+        conn.close()
+    print(f'generated {len(df)} rows')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+
+class FrameCache:
+    """
+    Bounded, thread-safe LRU of dataframes, or anything else derived from them, keyed by (name, generation).
+
+    A generation is any hashable value that changes when the underlying data changes, e.g. the row count and
+    max(query_time) of a metric.  Asking for a newer generation of a name evicts the older ones.  Cached frames are
+    shared between callbacks and must be treated as read-only.
+    """
+
+    def __init__(self, max_entries=8):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks = {}
+
+    def _load_lock(self, name):
+        with self._lock:
+            return self._load_locks.setdefault(name, threading.Lock())
+
+    def _lookup(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, self._entries[key]
+        return False, None
+
+    def get(self, name, generation, loader, update=None):
+        # update(df, generation), if given, derives the new frame from a stale one, e.g. by appending new rows.
+        # It may return None to fall back to loader().
+        key = (name, generation)
+        found, df = self._lookup(key)
+        if found:
+            return df
+        # serialize loads per name so concurrent page loads don't each run the same query
+        with self._load_lock(name):
+            found, df = self._lookup(key)
+            if found:
+                return df
+            with self._lock:
+                previous = [(k, v) for k, v in self._entries.items() if k[0] == name]
+            df = None
+            if update is not None and previous:
+                (_, stale_generation), stale_df = previous[-1]
+                df = update(stale_df, stale_generation)
+            if df is None:
+                df = loader()
+            with self._lock:
+                self.misses += 1
+                for stale in [k for k in self._entries if k[0] == name]:
+                    del self._entries[stale]
+                self._entries[key] = df
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return df
+
+    def invalidate(self, name=None):
+        with self._lock:
+            if name is None:
+                self._entries.clear()
+                return
+            for k in [k for k in self._entries if k[0] == name]:
+                del self._entries[k]
+
+    def update(self, key, old, new):
+        # replaces the entry at key (a (name, generation) pair) with new, unless it was evicted or replaced since old
+        # was read from it. Readers still holding old are unaffected
+        with self._lock:
+            if self._entries.get(key) is old:
+                self._entries[key] = new
+
+    def items(self):
+        # snapshot of ((name, generation), frame) pairs, least recently used first
+        with self._lock:
+            return list(self._entries.items())
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class CachedFigure:
+    """A figure serialized once and shared by every request for it."""
+
+    def __init__(self, fig):
+        self.json = fig.to_json()
+        self.etag = hashlib.sha1(self.json.encode()).hexdigest()
+        self.figure = json.loads(self.json)
@@ -0,0 +1,163 @@
+import select
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import sql
+from psycopg2.pool import PoolError
+
+
+class Database:
+    """
+    Blocking, thread-safe pool of postgres connections.
+
+    Each caller checks out its own connection for the duration of a unit of work, so callbacks serving different
+    browsers run in parallel.  Connections idle for longer than healthcheck_seconds are pinged before reuse, broken
+    connections are discarded and replaced, and run() retries work that failed because the connection was lost.
+    """
+
+    def __init__(self, size=4, statement_timeout='30s', healthcheck_seconds=30.0, checkout_timeout=30.0,
+                 **connect_kwargs):
+        self.size = size
+        self.statement_timeout = statement_timeout
+        self.healthcheck_seconds = healthcheck_seconds
+        self.checkout_timeout = checkout_timeout
+        self._connect_kwargs = connect_kwargs
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        return psycopg2.connect(options=f'-c statement_timeout={self.statement_timeout}', **self._connect_kwargs)
+
+    def _healthy(self, conn, last_used):
+        if conn.closed:
+            return False
+        if time.monotonic() - last_used < self.healthcheck_seconds:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1;')
+            conn.rollback()
+        except psycopg2.Error:
+            conn.close()
+            return False
+        return True
+
+    def _checkout(self):
+        if not self._slots.acquire(timeout=self.checkout_timeout):
+            raise PoolError(f'no database connection available after {self.checkout_timeout}s')
+        try:
+            while True:
+                with self._lock:
+                    if not self._idle:
+                        break
+                    conn, last_used = self._idle.pop()
+                if self._healthy(conn, last_used):
+                    return conn
+            return self._connect()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _checkin(self, conn):
+        if not conn.closed:
+            with self._lock:
+                self._idle.append((conn, time.monotonic()))
+        self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        # commits on success and rolls back on error, like psycopg2's own `with conn:`
+        conn = self._checkout()
+        try:
+            yield conn
+            if not conn.closed:
+                conn.commit()
+        except Exception:
+            if not conn.closed:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    conn.close()
+            raise
+        finally:
+            self._checkin(conn)
+
+    def run(self, fn, retries=1):
+        # runs fn(conn), retrying on a fresh connection if the one it was given died underneath it
+        attempt = 0
+        while True:
+            with self.connection() as conn:
+                try:
+                    return fn(conn)
+                except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+                    if attempt >= retries or not conn.closed:
+                        raise
+                    print(f'lost database connection, reconnecting: {e}')
+            attempt += 1
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            conn.close()
+
+
+class Listener:
+    """
+    LISTENs on a postgres channel from a background thread, calling on_notify(payload) for each notification.
+
+    epoch is bumped on every notification and every (re)connect, so anything cached while it was unchanged cannot
+    have missed a notification.  The connection is re-established after reconnect_seconds if it drops.
+    """
+
+    def __init__(self, channel, on_notify, reconnect_seconds=5.0, **connect_kwargs):
+        self.channel = channel
+        self.on_notify = on_notify
+        self.reconnect_seconds = reconnect_seconds
+        self.epoch = 0
+        self.connected = False
+        self._connect_kwargs = connect_kwargs
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f'listen-{channel}', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(**self._connect_kwargs)
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(sql.SQL('LISTEN {};').format(sql.Identifier(self.channel)))
+                self.epoch += 1
+                self.connected = True
+                self._listen(conn)
+            except psycopg2.Error as e:
+                print(f'{self.channel} listener disconnected, retrying in {self.reconnect_seconds}s: {e}')
+            finally:
+                self.connected = False
+                if conn is not None:
+                    conn.close()
+            self._stop.wait(self.reconnect_seconds)
+
+    def _listen(self, conn):
+        while not self._stop.is_set():
+            if select.select([conn], [], [], 1.0) == ([], [], []):
+                continue
+            conn.poll()
+            while conn.notifies:
+                notify = conn.notifies.pop(0)
+                self.epoch += 1
+                try:
+                    self.on_notify(notify.payload)
+                except Exception as e:
+                    print(f'{self.channel} listener: got exception type {type(e)}:\n{e}')
@@ -0,0 +1,66 @@
+import re
+
+import numpy
+import pandas as pd
+
+# a pod's generated suffixes: the replicaset's pod template hash, if any, and the pod's own random 5 characters. Both
+# are drawn from kubernetes' generated name alphabet, which has no vowels (nor 0, 1 or 3), so words like -proxy or
+# -agent ending a pod's real name are kept
+_alphabet = 'bcdfghjklmnpqrstvwxz2456789'
+_generated_suffix = re.compile(rf'-(?:[{_alphabet}]{{6,10}}-)?[{_alphabet}]{{5}}$')
+
+other = 'other'
+
+
+def workload_name(pod=''):
+    # controller-manager-c28hw -> controller-manager, machine-approver-fd55d58bb-mpcrr -> machine-approver. Names
+    # without a generated suffix (static pods, statefulset pods) are their own workload.
+    return _generated_suffix.sub('', pod)
+
+
+def workloads(pods) -> pd.Categorical:
+    # workload names for a categorical pod column; each distinct pod name is only parsed once. A slice of a frame (e.g.
+    # one group's rows) keeps every category of the whole column, so only the pods actually present are named
+    pods = pd.Categorical(pods).remove_unused_categories()
+    codes, uniques = pd.factorize([workload_name(p) for p in pods.categories])
+    mapped = numpy.append(codes, -1)[pods.codes]
+    return pd.Categorical.from_codes(mapped, categories=uniques)
+
+
+class Usage:
+    """
+    One group's usage per workload and version: matrix[i, j] is the sum of op over workload i's pods in version j.
+
+    Workloads are ranked by their peak over all versions, largest first, so a page of the ranking is a slice of rows
+    and everything outside it is the column totals minus that slice.
+    """
+
+    def __init__(self, df=pd.DataFrame(), op='', version_order=()):
+        names = workloads(df['pod'])
+        versions = pd.Categorical(df['version'], categories=list(version_order))
+        keep = (names.codes >= 0) & (versions.codes >= 0)
+        shape = (len(names.categories), len(version_order))
+        cells = names.codes[keep].astype(int) * shape[1] + versions.codes[keep]
+        values = numpy.nan_to_num(df[op].values[keep].astype('float64'))
+        matrix = numpy.bincount(cells, weights=values, minlength=shape[0] * shape[1]).reshape(shape)
+        order = numpy.argsort(-matrix.max(axis=1, initial=0), kind='stable')
+        self.names = [str(n) for n in names.categories[order]]
+        self.versions = [str(v) for v in version_order]
+        self.matrix = matrix[order]
+        self.totals = matrix.sum(axis=0)
+
+    def __len__(self):
+        return len(self.names)
+
+    def pages(self, per_page=20):
+        return max(1, -(-len(self.names) // per_page))
+
+    def page(self, page=1, per_page=20):
+        # [(name, values)] for the page's workloads, then the other bucket summing every workload not on it
+        start = (max(1, min(page, self.pages(per_page))) - 1) * per_page
+        rows = self.matrix[start:start + per_page]
+        traces = list(zip(self.names[start:start + per_page], rows))
+        rest = len(self.names) - len(rows)
+        if rest:
+            traces.append((f'{other} ({rest} workloads)', self.totals - rows.sum(axis=0)))
+        return traces
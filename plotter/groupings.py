@@ -0,0 +1,107 @@
+import os
+import re
+import threading
+
+import numpy
+import pandas as pd
+import yaml
+
+# namespaces matching no rule are assigned to this group. Must match the fallback in sql/rollup.sql
+other_group = 'other'
+
+_wildcards = re.compile(r'[*?]')
+
+
+def is_pattern(rule=''):
+    return _wildcards.search(rule) is not None
+
+
+def glob_to_regex(rule=''):
+    return re.compile(''.join('.*' if c == '*' else '.' if c == '?' else re.escape(c) for c in rule))
+
+
+def glob_to_like(rule=''):
+    escaped = rule.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return escaped.replace('*', '%').replace('?', '_')
+
+
+class GroupIndex:
+    """
+    Compiled namespace -> group mapping loaded from component-mappings.yaml.
+
+    Rules are either exact namespace names or globs using * and ?, e.g. openshift-kube-*.  Exact names take
+    precedence over globs and globs are tried in file order.  Namespaces that match nothing fall into other_group.
+    """
+
+    def __init__(self, path='component-mappings.yaml'):
+        self.path = path
+        self._lock = threading.Lock()
+        self._mtime = None
+        # bumped on every (re)load, for caches of anything derived from the groupings
+        self.generation = 0
+        self._exact = {}
+        self._patterns = []
+        self.categories = [other_group]
+        self._load()
+
+    def _load(self):
+        mtime = os.stat(self.path).st_mtime_ns
+        with open(self.path, 'r') as file:
+            config = yaml.load(file, Loader=yaml.FullLoader) or {}
+        exact = {}
+        patterns = []
+        for grp, rules in config.items():
+            for rule in rules or []:
+                if is_pattern(rule):
+                    # first glob wins, so a repeated glob can never match
+                    if rule not in (p[0] for p in patterns):
+                        patterns.append((rule, glob_to_regex(rule), grp))
+                else:
+                    # later entries win, as they did when groups were assigned one namespace at a time
+                    exact[rule] = grp
+        self._exact = exact
+        self._patterns = patterns
+        self.categories = sorted(set(config.keys()) - {other_group}) + [other_group]
+        self._mtime = mtime
+        self.generation += 1
+
+    def reload_if_changed(self) -> bool:
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return False
+        with self._lock:
+            if mtime == self._mtime:
+                return False
+            try:
+                self._load()
+            except (yaml.YAMLError, AttributeError, TypeError) as e:
+                # keep serving the last good mapping until the file is fixed
+                print(f'failed to reload {self.path}, keeping previous groupings: {e}')
+                self._mtime = mtime
+                return False
+        return True
+
+    def lookup(self, namespace=''):
+        grp = self._exact.get(namespace)
+        if grp is not None:
+            return grp
+        for _, regex, grp in self._patterns:
+            if regex.fullmatch(namespace):
+                return grp
+        return other_group
+
+    def assign(self, namespaces=pd.Series(dtype=object)) -> pd.Categorical:
+        # rules are only evaluated once per distinct namespace, rows are then mapped with a single take()
+        codes, uniques = pd.factorize(namespaces)
+        categories = self.categories
+        unique_groups = pd.Categorical([self.lookup(ns) for ns in uniques], categories=categories).codes
+        other = categories.index(other_group)
+        group_codes = numpy.where(codes < 0, other, unique_groups.take(codes, mode='clip') if len(uniques) else other)
+        return pd.Categorical.from_codes(group_codes, categories=categories)
+
+    def rules(self):
+        # (LIKE pattern, group, priority) rows for the caliper_namespace_groups table
+        rows = [(glob_to_like(ns), grp, 0) for ns, grp in self._exact.items()]
+        rows += [(glob_to_like(rule), grp, i + 1) for i, (rule, _, grp) in enumerate(self._patterns)]
+        return rows
@@ -0,0 +1,26 @@
+import os
+import tempfile
+
+bind = f'0.0.0.0:{os.getenv("PLOTTER_PORT", "8050")}'
+workers = int(os.getenv('PLOTTER_WORKERS', '2'))
+threads = int(os.getenv('PLOTTER_THREADS', '4'))
+# load and render everything once in the master, workers share it copy-on-write
+preload_app = True
+timeout = 120
+
+# every worker writes its /metrics samples here, so any worker's scrape reports all of them (see instrument.py). Set
+# before the app is preloaded, as prometheus_client picks its storage when metrics are created.
+multiproc_dir = os.getenv('PROMETHEUS_MULTIPROC_DIR') or os.getenv('prometheus_multiproc_dir') \
+    or tempfile.mkdtemp(prefix='plotter-metrics-')
+# older prometheus_client releases only read the lower case name
+os.environ['PROMETHEUS_MULTIPROC_DIR'] = os.environ['prometheus_multiproc_dir'] = multiproc_dir
+
+
+def post_fork(server, worker):
+    import main
+    main.after_fork()
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,145 @@
+"""
+Latency histograms and counters for the plotter's callbacks and data stages, exposed in Prometheus text format.
+
+Under a multi-worker server, set PROMETHEUS_MULTIPROC_DIR (gunicorn.conf.py does) so every worker's observations are
+merged into each scrape.  Cache and frame gauges are read at scrape time from the worker that serves it.
+"""
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+import pandas as pd
+from flask import g, has_request_context, request
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client import multiprocess
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+log = logging.getLogger('plotter')
+
+content_type = CONTENT_TYPE_LATEST
+
+_buckets = (.005, .01, .025, .05, .1, .25, .5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+callback_seconds = Histogram('plotter_callback_seconds', 'Dash callback latency', ['callback'], buckets=_buckets)
+callback_errors = Counter('plotter_callback_errors', 'Dash callbacks that raised', ['callback'])
+stage_seconds = Histogram('plotter_stage_seconds', 'Latency of data loading and figure building stages', ['stage'],
+                          buckets=_buckets)
+rows_fetched = Counter('plotter_rows_fetched', 'Rows loaded from postgres or a snapshot', ['table'])
+
+
+@contextmanager
+def stage(name=''):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_seconds.labels(name).observe(elapsed)
+        if has_request_context():
+            g.setdefault('plotter_stages', []).append((name, elapsed))
+
+
+def timed(name=''):
+    # decorates a function to record its latency as the named stage
+    def wrap(fn):
+        @wraps(fn)
+        def timed_fn(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+
+        return timed_fn
+
+    return wrap
+
+
+def callback(name='', failed=None):
+    # decorates a Dash callback to record its latency and log, rather than raise, its exceptions. A failing callback
+    # returns failed, leaving (with dash.no_update) or blanking its outputs.
+    def wrap(fn):
+        @wraps(fn)
+        def instrumented(*args):
+            start = time.perf_counter()
+            try:
+                return fn(*args)
+            except Exception:
+                callback_errors.labels(name).inc()
+                log.exception(f'{name} failed')
+                return failed
+            finally:
+                callback_seconds.labels(name).observe(time.perf_counter() - start)
+
+        return instrumented
+
+    return wrap
+
+
+class CacheCollector:
+    """
+    Scrape time gauges for FrameCaches: entries, hit and miss counts, and the rows and memory of cached frames.
+
+    caches() returns the {name: FrameCache} to report on.
+    """
+
+    def __init__(self, caches=dict):
+        self.caches = caches
+
+    def collect(self):
+        hits = CounterMetricFamily('plotter_cache_hits', 'Cache lookups served from memory', labels=['cache'])
+        misses = CounterMetricFamily('plotter_cache_misses', 'Cache lookups that loaded or rebuilt', labels=['cache'])
+        entries = GaugeMetricFamily('plotter_cache_entries', 'Entries held by each cache', labels=['cache'])
+        frame_rows = GaugeMetricFamily('plotter_frame_rows', 'Rows of each cached frame', labels=['cache', 'frame'])
+        frame_bytes = GaugeMetricFamily('plotter_frame_bytes', 'Deep memory usage of each cached frame',
+                                        labels=['cache', 'frame'])
+        for cache_name, cache in self.caches().items():
+            if cache is None:
+                continue
+            hits.add_metric([cache_name], cache.hits)
+            misses.add_metric([cache_name], cache.misses)
+            entries.add_metric([cache_name], len(cache))
+            for (name, _), value in cache.items():
+                if isinstance(value, pd.DataFrame):
+                    frame = name if isinstance(name, str) else '/'.join(str(n) for n in name)
+                    frame_rows.add_metric([cache_name, frame], len(value))
+                    frame_bytes.add_metric([cache_name, frame], int(value.memory_usage(deep=True).sum()))
+        return [hits, misses, entries, frame_rows, frame_bytes]
+
+
+def _multiprocess_dir():
+    return os.getenv('PROMETHEUS_MULTIPROC_DIR') or os.getenv('prometheus_multiproc_dir')
+
+
+def exposition(collector=None) -> bytes:
+    # the /metrics response body: this process' (or every worker's) metrics, plus collector's
+    registry = CollectorRegistry()
+    if collector is not None:
+        registry.register(collector)
+    if _multiprocess_dir():
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY) + generate_latest(registry)
+
+
+def start_request():
+    g.plotter_started = time.perf_counter()
+
+
+def log_request(response):
+    # one JSON line per request: path, status, total time and the time of each stage it ran
+    started = g.get('plotter_started')
+    if started is None:
+        return response
+    entry = {
+        'method': request.method,
+        'path': request.path,
+        'status': response.status_code,
+        'seconds': round(time.perf_counter() - started, 6),
+        'stages': [[name, round(seconds, 6)] for name, seconds in g.get('plotter_stages', [])],
+    }
+    if request.path.endswith('_dash-update-component'):
+        body = request.get_json(silent=True) or {}
+        entry['output'] = body.get('output')
+    log.info(json.dumps(entry))
+    return response
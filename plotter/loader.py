@@ -0,0 +1,97 @@
+import os
+import threading
+
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+# postgres type oids, see pg_type.dat
+_float_oids = {21, 23, 20, 700, 701, 1700}  # int2, int4, int8, float4, float8, numeric
+_text_oids = {18, 19, 25, 1042, 1043}  # char, name, text, bpchar, varchar
+_time_oids = {1082, 1114, 1184}  # date, timestamp, timestamptz
+
+# size of the reads psycopg2 makes from the COPY stream
+copy_buffer_bytes = 1 << 20
+
+
+def column_types(conn, query='', float_dtype='float64'):
+    # names and dtypes of the query's columns, without fetching any rows
+    with conn.cursor() as cur:
+        cur.execute(f'SELECT * FROM ({query}) q LIMIT 0;')
+        desc = [(col.name, col.type_code) for col in cur.description]
+    dtypes = {}
+    dates = []
+    for name, oid in desc:
+        if oid in _float_oids:
+            dtypes[name] = float_dtype
+        elif oid in _text_oids:
+            dtypes[name] = 'category'
+        elif oid in _time_oids:
+            dates.append(name)
+    return [d[0] for d in desc], dtypes, dates
+
+
+def read_frame(conn, query='', params=None, float_dtype='float64') -> pd.DataFrame:
+    """
+    Load the result of query straight into typed columns.
+
+    Rows are streamed out of postgres as CSV with COPY and parsed incrementally by pandas, so no python object is
+    created per row or value.  Numeric columns come back as float_dtype (float64, or float32 to halve their size), text
+    columns as categoricals and timestamps as datetime64.
+    """
+    with conn.cursor() as cur:
+        query = cur.mogrify(query.strip().rstrip(';'), params).decode()
+    names, dtypes, dates = column_types(conn, query, float_dtype)
+
+    read_fd, write_fd = os.pipe()
+    errors = []
+
+    def produce():
+        try:
+            with os.fdopen(write_fd, 'wb') as w, conn.cursor() as cur:
+                cur.copy_expert(f'COPY ({query}) TO STDOUT WITH (FORMAT csv)', w, size=copy_buffer_bytes)
+        except Exception as e:
+            errors.append(e)
+
+    producer = threading.Thread(target=produce, name='read_frame', daemon=True)
+    producer.start()
+    try:
+        try:
+            # closing the read end on a parse error breaks the pipe, which unblocks and ends the producer
+            with os.fdopen(read_fd, 'rb') as r:
+                df = pd.read_csv(r, header=None, names=names, dtype=dtypes, parse_dates=dates,
+                                 keep_default_na=False, na_values=[''])
+        finally:
+            producer.join()
+    except Exception as e:
+        # the producer's error is either what truncated the stream or the broken pipe this error caused, keep both
+        if errors:
+            raise e from errors[0]
+        raise
+    if errors:
+        # the stream ended cleanly, but the COPY didn't
+        raise errors[0]
+    if len(df) == 0:
+        # nothing was parsed, so the date columns never got their dtype
+        df = empty_frame(names, dtypes, dates)
+    return df
+
+
+def empty_frame(names, dtypes, dates) -> pd.DataFrame:
+    return pd.DataFrame({n: pd.Series(dtype='datetime64[ns]' if n in dates else dtypes.get(n, object)) for n in names})
+
+
+def concat_frames(a=pd.DataFrame(), b=pd.DataFrame()) -> pd.DataFrame:
+    # like pd.concat, but categorical columns stay categorical (with the union of both sides' categories)
+    columns = {}
+    for c in a.columns:
+        if hasattr(a[c], 'cat') and hasattr(b[c], 'cat'):
+            columns[c] = union_categoricals([a[c], b[c]], ignore_order=True)
+        else:
+            columns[c] = pd.concat([a[c], b[c]], ignore_index=True)
+    return pd.DataFrame(columns)
+
+
+def memory_usage(df=pd.DataFrame()) -> dict:
+    # deep size of a frame and of each of its columns; a categorical's strings are counted once, not once per row
+    usage = df.memory_usage(deep=True)
+    return {'rows': len(df), 'bytes': int(usage.sum()), 'columns': {c: int(b) for c, b in usage.items()}}
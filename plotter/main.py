@@ -1,139 +1,397 @@
+import logging
 import os
+import threading
+import time
 
 import dash
+import numpy
 import dash_core_components as dcc
 import dash_html_components as html
-import numpy
+import dash_table
 import pandas as pd
-import psycopg2
-import semver
-import yaml
-from dash.dependencies import Input, Output
+from dash.dependencies import ClientsideFunction, Input, Output, State
 from dotenv import load_dotenv
+from flask import Response, abort, jsonify, request
 from plotly import express as px
 from plotly import graph_objects as go
 
-# for debugging dataframes printed to console
-pd.set_option('min_rows', 10)
-pd.set_option('max_rows', 500)
-pd.set_option('display.max_columns', 20)
-pd.set_option('display.width', 1098)
-
-load_dotenv()
-pg_host = os.getenv('PGHOST')
-pg_port = os.getenv('PGPORT')
-pg_database = os.getenv('PGDATABASE')
-pg_user = os.getenv('PGUSER')
-pg_password = os.getenv('PGPASSWORD')
-conn = psycopg2.connect(
-    host=pg_host,
-    port=pg_port,
-    database=pg_database,
-    user=pg_user,
-    password=pg_password
-)
-
-with open('component-mappings.yaml', 'r') as file:
-    group_config = yaml.load(file, Loader=yaml.FullLoader)
-    file.close()
+import aggregation
+import drilldown
+import instrument
+import loader
+import regression
+import rollup
+import snapshot
+import timings
+import versions
+from cache import CachedFigure, FrameCache
+from db import Database, Listener
+from groupings import GroupIndex
 
 value_columns = ['q95_value', 'avg_value', 'min_value', 'max_value']
-
-
+rollup_max_columns = [f'{v}_max' for v in value_columns]
+
+# the columns kept in raw frames; owner_name, inst_value and anything else in caliper_metrics is never charted
+frame_columns = ['version', 'metric', 'node', 'pod', 'namespace'] + value_columns + ['query_time', 'range']
+
+mem_metric = 'container_memory_bytes'
+cpu_metric = 'cpu_usage_ratio'
+
+# set by init(), so importing this module reads, connects to and starts nothing
+pg_connect = {}
+# with a snapshot directory (see snapshot.py), charts are served from it and no database is used at all
+source = None
+db = None
+group_index = None
+frames = None
+figures = None
+summaries = None
+float_dtype = 'float64'
+notify_channel = ''
+drilldown_page_size = 20
+regression_rows = 50
+_init_lock = threading.Lock()
+rollup_installed = False
+_rollup_lock = threading.Lock()
+
+# subscribed to the channel prom-top notifies after each insert, see start_listener()
+listener = None
+known_generations = {}
+generation_max_age = 30.0
+# {metric: generation} trusted without asking the database, e.g. by report.py's forked renderers
+pinned_generations = {}
+
+
+def init():
+    # reads .env, the environment and component-mappings.yaml, and creates the data source and caches. No
+    # connection is made until data is first needed. Safe to call more than once.
+    global pg_connect, source, db, group_index, frames, figures, summaries, float_dtype, notify_channel, \
+        generation_max_age, drilldown_page_size, regression_rows
+    with _init_lock:
+        if group_index is not None:
+            return
+
+        # for debugging dataframes printed to console
+        pd.set_option('min_rows', 10)
+        pd.set_option('max_rows', 500)
+        pd.set_option('display.max_columns', 20)
+        pd.set_option('display.width', 1098)
+
+        logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+        load_dotenv()
+        pg_connect = dict(
+            host=os.getenv('PGHOST'),
+            port=os.getenv('PGPORT'),
+            database=os.getenv('PGDATABASE'),
+            user=os.getenv('PGUSER'),
+            password=os.getenv('PGPASSWORD')
+        )
+        snapshot_dir = os.getenv('PLOTTER_SNAPSHOT_DIR', '')
+        if snapshot_dir:
+            source = snapshot.Snapshot(snapshot_dir)
+        else:
+            db = Database(
+                size=int(os.getenv('PLOTTER_DB_POOL_SIZE', '4')),
+                statement_timeout=os.getenv('PLOTTER_DB_STATEMENT_TIMEOUT', '30s'),
+                healthcheck_seconds=float(os.getenv('PLOTTER_DB_HEALTHCHECK_SECONDS', '30')),
+                **pg_connect
+            )
+        # float32 halves the size of the value columns, at the cost of precision no chart shows
+        if os.getenv('PLOTTER_FRAME_FLOAT32', '').lower() in ('1', 'true', 'yes'):
+            float_dtype = 'float32'
+        frames = FrameCache(max_entries=int(os.getenv('PLOTTER_CACHE_ENTRIES', '8')))
+        figures = FrameCache(max_entries=int(os.getenv('PLOTTER_FIGURE_CACHE_ENTRIES', '64')))
+        summaries = FrameCache(max_entries=int(os.getenv('PLOTTER_SUMMARY_CACHE_ENTRIES', '32')))
+        notify_channel = os.getenv('PLOTTER_NOTIFY_CHANNEL', 'caliper_metrics')
+        generation_max_age = float(os.getenv('PLOTTER_GENERATION_MAX_AGE_SECONDS', '30'))
+        drilldown_page_size = int(os.getenv('PLOTTER_DRILLDOWN_PAGE_SIZE', '20'))
+        regression_rows = int(os.getenv('PLOTTER_REGRESSION_ROWS', '50'))
+        group_index = GroupIndex('component-mappings.yaml')
+
+
+def install_rollup():
+    # creates the rollup view, and loads the groupings into postgres, on first use
+    global rollup_installed
+    with _rollup_lock:
+        if not rollup_installed:
+            db.run(lambda conn: rollup.install(conn, group_index.rules()))
+            rollup_installed = True
+
+
+@instrument.timed('to_float')
 def db_numeric_to_float(df):
     for v in value_columns:
-        df[v] = df[v].astype('float')
+        if df[v].dtype != float_dtype:
+            df[v] = df[v].astype(float_dtype)
     df = assign_groupings(df)
     return df
 
 
-def order_versions():
-    versions = []
-    try:
-        v = semver.VersionInfo.parse('4.6.0')
-        versions.append(str(v))
-        # inc minor ver
-        for i in range(1):
-            # inc patch ver
-            for k in range(20):
-                v = v.bump_patch()
-                versions.append(str(v))
-            v = v.replace(patch=0)
-            v = v.bump_minor()
-            versions.append(str(v))
-    except Exception as e:
-        print(f"exception: {e}")
-        pass
-    return versions
-
-
 def df_mem_bytes_to_gigabytes(df):
     for v in value_columns:
         df[v] = df[v] / 10.0 ** 9
     return df
 
 
+@instrument.timed('assign_groupings')
 def assign_groupings(df=pd.DataFrame()):
-    groups = numpy.empty(len(df), dtype=object)
-    try:
-        df.insert(len(df.columns), 'group', groups)
-    except KeyError as e:
-        print(f"dataframe exception: {e}")
-    for grp, namespaces in group_config.items():
-        for ns in namespaces:
-            df.loc[df['namespace'] == ns, ['group']] = grp
+    df['group'] = group_index.assign(df['namespace'])
     return df
 
 
-def executeQuery(query):
-    cur = conn.cursor()
-    cur.execute(query)
-    desc = cur.description
-    columns = [col[0] for col in desc]
-    rows = [row for row in cur.fetchall()]
-    df = pd.DataFrame([[c for c in r] for r in rows])
-    df.rename(inplace=True, columns=dict(enumerate(columns)))
+def refresh_groupings():
+    # picks up edits to component-mappings.yaml without a restart. Cached raw frames are replaced by copies with only
+    # their group column recomputed, as other callbacks may be reading them; rollups are regrouped by postgres and
+    # refetched.
+    if not group_index.reload_if_changed():
+        return
+    if db is not None and rollup_installed:
+        db.run(lambda conn: rollup.sync_groups(conn, group_index.rules()))
+    for (name, generation), df in frames.items():
+        if name.endswith('/rollup'):
+            frames.invalidate(name)
+        else:
+            frames.update((name, generation), df, assign_groupings(df.copy(deep=False)))
+
+
+def executeQuery(query, params=None):
+    with instrument.stage('query'):
+        df = db.run(lambda conn: loader.read_frame(conn, query, params, float_dtype))
+    instrument.rows_fetched.labels('caliper_metrics').inc(len(df))
     df = db_numeric_to_float(df)
     return df
 
 
-def sort_by_version(df=pd.DataFrame()) -> pd.DataFrame:
-    df['version'] = df['version'].map(semver.parse_version_info)
-    df.sort_values(by='version', inplace=True)
-    df['version'] = df['version'].astype(dtype=str)
-    return df
+@instrument.timed('generation')
+def data_generation(metric=''):
+    # cheap fingerprint of a metric's rows; changes whenever prom-top inserts a new run. The row count is only taken
+    # every generation_max_age (in case of deletes or a silent writer). In between, it's remembered until the next
+    # notification while the ingest listener is connected, or else until max(query_time) moves, which the rollup's
+    # (metric, query_time) index answers without counting.
+    if metric in pinned_generations:
+        return pinned_generations[metric]
+    if source is not None:
+        return source.generation(metric)
+    epoch = listener.epoch if listener is not None else None
+    known = known_generations.get(metric)
+    if known is not None and known[0] == epoch and time.monotonic() - known[1] < generation_max_age:
+        if epoch is not None and listener.connected:
+            return known[2]
+
+        def latest(conn):
+            with conn.cursor() as cur:
+                cur.execute("SELECT max(query_time) FROM caliper_metrics WHERE metric = %s;", (metric,))
+                return cur.fetchone()[0]
+
+        if db.run(latest) == known[2][1]:
+            return known[2]
+
+    def query(conn):
+        with conn.cursor() as cur:
+            cur.execute("SELECT count(*), max(query_time) FROM caliper_metrics WHERE metric = %s;", (metric,))
+            return cur.fetchone()
+
+    generation = db.run(query)
+    known_generations[metric] = (epoch, time.monotonic(), generation)
+    return generation
+
+
+def metrics_query(metric='', since=None):
+    query = f"SELECT {', '.join(frame_columns)} FROM caliper_metrics WHERE metric = %s"
+    params = (metric,)
+    if since is not None:
+        query += " AND query_time > %s"
+        params += (since,)
+    return query + ';', params
+
+
+def read_metrics(metric='', since=None):
+    if source is not None:
+        with instrument.stage('snapshot_read'):
+            df = source.read(metric, 'raw', frame_columns, since)
+        instrument.rows_fetched.labels('snapshot').inc(len(df))
+        return db_numeric_to_float(df)
+    return executeQuery(*metrics_query(metric, since))
+
+
+@instrument.timed('load_metrics')
+def load_mem_metrics(since=None):
+    df = read_metrics(mem_metric, since)
+    df = df_mem_bytes_to_gigabytes(df)
+    return versions.index_versions(df)
+
+
+@instrument.timed('load_metrics')
+def load_cpu_metrics(since=None):
+    df = read_metrics(cpu_metric, since)
+    for v in value_columns:
+        df[v] = df[v] * 100
+    return versions.index_versions(df)
+
+
+def append_metrics(load, generation):
+    # FrameCache update for raw frames: fetch only the rows past the cached frame's query_time watermark
+    def update(df, previous):
+        rows, _ = generation
+        _, watermark = previous
+        if watermark is None:
+            return None
+        df = versions.index_versions(loader.concat_frames(df, load(since=watermark)))
+        if len(df) != rows:
+            # rows were deleted or backfilled under the watermark, only a full reload can tell which
+            return None
+        return df
+
+    return update
+
+
+metric_loaders = {
+    mem_metric: load_mem_metrics,
+    cpu_metric: load_cpu_metrics,
+}
+
+
+# get_*_metrics return frames shared by all callbacks, do not modify them in place.
+def get_metrics(metric='', generation=None):
+    if generation is None:
+        refresh_groupings()
+        generation = data_generation(metric)
+    load = metric_loaders[metric]
+    return frames.get(metric, generation, load, append_metrics(load, generation))
 
 
 def get_mem_metrics():
-    query_mem = """
-    SELECT * FROM caliper_metrics WHERE metric = 'container_memory_bytes';
-    """
-    df = executeQuery(query_mem)
-    df = df_mem_bytes_to_gigabytes(df)
-    return df
+    return get_metrics(mem_metric)
 
 
 def get_cpu_metrics():
-    query_cpu = """
-    SELECT * FROM caliper_metrics WHERE metric = 'cpu_usage_ratio';
-    """
-    df = executeQuery(query_cpu)
-    for v in value_columns:
-        df[v] = df[v] * 100
+    return get_metrics(cpu_metric)
+
+
+def get_summary(metric='', by=('version', 'group')) -> pd.DataFrame:
+    # every statistic of the metric's raw rows per distinct by, see aggregation.summarize(). Computed once per data
+    # and groupings generation, and shared by everything grouping the same way.
+    refresh_groupings()
+    generation = data_generation(metric)
+
+    def load():
+        df = get_metrics(metric, generation)
+        with instrument.stage('summarize'):
+            return aggregation.summarize(df, by)
+
+    return summaries.get((metric, tuple(by)), (generation, group_index.generation), load)
+
+
+def get_regressions(metric='') -> regression.Matrix:
+    # the metric's per group and namespace usage across versions, see regression.Matrix. A new run only summarizes
+    # the rows of the versions it wrote, adding (or replacing) their columns.
+    refresh_groupings()
+    generation = data_generation(metric)
+    by = ['version'] + regression.keys
+
+    def load():
+        summary = get_summary(metric, by)
+        with instrument.stage('regressions'):
+            return regression.Matrix(summary, versions.ordered(summary))
+
+    def update(matrix, previous):
+        (_, watermark), groupings = previous
+        if watermark is None or groupings != group_index.generation:
+            return None
+        df = get_metrics(metric, generation)
+        with instrument.stage('regressions'):
+            changed = df['version'][df['query_time'] > pd.Timestamp(watermark)].unique()
+            matrix = matrix.update(aggregation.summarize(df[df['version'].isin(changed)], by), versions.ordered(df))
+        if matrix.rows.sum() != generation[0]:
+            # rows were deleted or backfilled under the watermark
+            return None
+        return matrix
+
+    return summaries.get((metric, 'regressions'), (generation, group_index.generation), load, update)
+
+
+def snapshot_rollup(metric='', since=None) -> pd.DataFrame:
+    # the snapshot's per namespace aggregates, computed from its raw rows if it was exported without them
+    if source.has_rollup(metric):
+        df = source.read(metric, 'rollup', since=since)
+    else:
+        df = snapshot.aggregate(source.read(metric, 'raw', frame_columns, since=since))
+    return snapshot.regroup(df, group_index.assign, float_dtype)
+
+
+@instrument.timed('load_rollup')
+def load_rollup(metric='', generation=None, since=None) -> pd.DataFrame:
+    if source is not None:
+        return snapshot_rollup(metric, since)
+
+    install_rollup()
+
+    # prom-top refreshes the rollup on ingest, this only catches up when it didn't (e.g. an older prom-top)
+    def query(conn):
+        if rollup.generation(conn, metric) != generation:
+            rollup.refresh(conn)
+        return rollup.read(conn, metric, since, float_dtype)
+
+    df = db.run(query)
+    instrument.rows_fetched.labels('caliper_metrics_rollup').inc(len(df))
     return df
 
 
+rollup_scale = {
+    mem_metric: 10.0 ** -9,
+    cpu_metric: 100,
+}
+
+
+def get_rollup(metric=''):
+    def load(since=None):
+        df = load_rollup(metric, generation, since)
+        for v in value_columns + rollup_max_columns:
+            df[v] = df[v] * rollup_scale[metric]
+        return versions.index_versions(df)
+
+    def update(df, previous):
+        # replace the rows of only the versions that gained raw rows since the cached rollup was read
+        _, watermark = previous
+        if watermark is None:
+            return None
+        changed = load(since=watermark)
+        kept = df[~df['version'].isin(changed['version'])]
+        df = versions.index_versions(loader.concat_frames(kept, changed))
+        if df['rows'].sum() != generation[0]:
+            return None
+        return df
+
+    refresh_groupings()
+    generation = data_generation(metric)
+    return frames.get(f'{metric}/rollup', generation, load, update)
+
+
+def get_mem_rollup():
+    return get_rollup(mem_metric)
+
+
+def get_cpu_rollup():
+    return get_rollup(cpu_metric)
+
+
+def group_sums(df=pd.DataFrame()) -> pd.DataFrame:
+    return df[['version', 'group'] + value_columns]
+
+
+def group_maxima(df=pd.DataFrame()) -> pd.DataFrame:
+    return df[['version', 'group'] + rollup_max_columns].rename(columns=dict(zip(rollup_max_columns, value_columns)))
+
+
 def trim_and_group(df, op=''):
-    df = df.groupby(by=['version', 'group'], sort=True, as_index=False).sum()
-    df = df.groupby(by=['version'], sort=True, as_index=False).apply(
-        lambda frame: frame.sort_values(by=[op], inplace=False))
-    df.reset_index(inplace=True)
-    return df
+    # expects version/group sums, as returned by group_sums()
+    return df.sort_values(by=['version', op], inplace=False).reset_index(drop=True)
 
 
 def get_max_bar_height(df=pd.DataFrame()):
-    df_summed = df.groupby(by=['version']).sum()
-    m = max(df_summed.select_dtypes(include='float64').max())
+    df_summed = df.groupby(by=['version'], observed=True).sum(numeric_only=True)
+    m = max(df_summed.select_dtypes(include='floating').max())
     return m
 
 
@@ -145,45 +403,17 @@ def color_map(df=pd.DataFrame(), by='') -> dict:
     cm = {}
     colors = px.colors.qualitative.G10
     try:
-        grp = df.groupby(by=by, as_index=True, sort=True)
+        grp = df.groupby(by=by, as_index=True, sort=True, observed=True)
     except Exception as e:
         raise KeyError(f'color_map.dataframe.groupby: {type(e)}: input value {e} raised exception')
     i = 0
     for g in grp.groups:
-        cm[g] = colors[i]
+        cm[g] = colors[i % len(colors)]
         i += 1
     return cm
 
 
-def pod_max(df=pd.DataFrame(), op='', by='') -> pd.DataFrame():
-    return df.groupby(by=['version', by, op], sort=True, as_index=True).max(numeric_only=True).reset_index()
-
-
-
-def pod_min(df=pd.DataFrame()) -> pd.DataFrame(): return
-
-
-def pod_avg(df=pd.DataFrame()) -> pd.DataFrame(): return
-
-
-def pod_q95(df=pd.DataFrame()) -> pd.DataFrame(): return
-
-
-op_map = {
-    'max': pod_max,
-    'min': pod_min,
-    'avg': pod_avg,
-    'q95': pod_q95,
-}
-
-
-def operators(df=pd.DataFrame()) -> pd.DataFrame(): return
-
-
 def bar_fig(df=pd.DataFrame(), op='', y_max=0.0, title='', y_title='', x_title='', suffix='', legend_title=''):
-    df['version'] = df['version'].map(semver.parse_version_info)
-    df.sort_values(by=['version'], inplace=True)
-    df['version'] = df['version'].astype(dtype=str)
     fig = px.bar(
         data_frame=df,
         x='version',
@@ -191,6 +421,7 @@ def bar_fig(df=pd.DataFrame(), op='', y_max=0.0, title='', y_title='', x_title='
         color='group',
         title=title,
         color_discrete_map=color_map(df, by='group'),
+        category_orders={'version': versions.ordered(df)},
     )
     fig.update_yaxes(
         go.layout.YAxis(
@@ -228,19 +459,19 @@ def line_fig(df=pd.DataFrame(), op='', y_max=0.0, title='', y_title='', x_title=
         "range": [0, y_max]
     })
     fig.update_xaxes({
-        "title": x_title
+        "title": x_title,
+        "categoryorder": 'array',
+        "categoryarray": versions.ordered(df),
     })
     try:
         cm = color_map(df, by='group')
-        groups = df.groupby(by='group', sort=True)
+        groups = df.groupby(by='group', sort=True, observed=True)
         for name, g in groups:
-            g['version'] = g['version'].map(semver.parse_version_info)
-            g.sort_values(by='version', inplace=True)
-            g['version'] = g['version'].astype(str)
+            g = g.sort_values(by='version')
             fig.add_trace(
                 go.Scatter(
                     name=name,
-                    x=g['version'],
+                    x=g['version'].astype(str),
                     y=g[op],
                     legendgroup=1,
                     marker={'color': cm[name]},
@@ -253,8 +484,8 @@ def line_fig(df=pd.DataFrame(), op='', y_max=0.0, title='', y_title='', x_title=
 
 
 def bar_group_fig(df=pd.DataFrame(), op='', y_max=0.0, title='', y_title='', x_title='', tick_suffix=''):
-    df = df[['version', 'group', 'namespace', 'pod', op]]
-    df = df.groupby(by=['version', 'group']).max().reset_index()
+    df = df[['version', 'group', op]]
+    df = df.groupby(by=['version', 'group'], observed=True).max().reset_index()
 
     y_max = pad_range(df[op].max())
 
@@ -272,23 +503,55 @@ def bar_group_fig(df=pd.DataFrame(), op='', y_max=0.0, title='', y_title='', x_t
         }
     )
     fig.update_xaxes({
-        'title': x_title
+        'title': x_title,
+        'categoryorder': 'array',
+        'categoryarray': versions.ordered(df),
     })
-    try:
-        cm = color_map(df, by='group')
-        versions = pd.unique(df['version'])
-        for name, group in df.groupby(by='group', sort=True):
-            fig.add_trace(
-                go.Bar(
-                    name=name,
-                    x=versions,
-                    y=group[op],
-                    legendgroup=1,
-                    marker={'color': cm[name]}
-                )
+    # failures raise to the callback, which logs and counts them, rather than serving a figure missing groups
+    cm = color_map(df, by='group')
+    for name, group in df.groupby(by='group', sort=True, observed=True):
+        fig.add_trace(
+            go.Bar(
+                name=name,
+                x=group['version'].astype(str),
+                y=group[op],
+                legendgroup=1,
+                marker={'color': cm[name]}
             )
-    except Exception as e:
-        print(f'bar_group_fig: {e}')
+        )
+    return fig
+
+
+def drilldown_fig(usage=None, page=1, per_page=20, title='', y_title='', x_title='', tick_suffix=''):
+    # one WebGL trace per workload on the page and one for all the others, so the browser never gets more than
+    # per_page + 1 traces however many pods the group has
+    fig = go.Figure()
+    fig.update_layout({
+        'title': title,
+        'legend': {'traceorder': 'normal'},
+    })
+    fig.update_yaxes({
+        'title': y_title,
+        'ticksuffix': tick_suffix,
+        'fixedrange': True,
+        'rangemode': 'tozero',
+    })
+    fig.update_xaxes({
+        'title': x_title,
+        'type': 'category',
+        'categoryorder': 'array',
+        'categoryarray': usage.versions,
+    })
+    for name, values in usage.page(page, per_page):
+        fig.add_trace(
+            go.Scattergl(
+                name=name,
+                x=usage.versions,
+                # a workload absent from a version is a gap, not a zero
+                y=numpy.where(values == 0, numpy.nan, values),
+                mode='lines+markers',
+            )
+        )
     return fig
 
 
@@ -299,108 +562,487 @@ radio_options = [
     {'label': 'Max', 'value': 'max_value'},
 ]
 
-app = dash.Dash(__name__, external_stylesheets=['./style.css'])
-app.layout = html.Div(children=[
-    html.H1(children='Caliper - Basic Dashboard'),
-    html.H2(children='Net Resource Usage by an Idle 6 Node Cluster, Span 10min'),
-    html.Div(children=[
-        dcc.Graph(id='mem-group'),
-        dcc.RadioItems(id='memory-group-op-radio', value='q95_value', options=radio_options),
-    ]),
-    html.Div(children=[
-        dcc.Graph(id='memory-graph'),
-        dcc.RadioItems(id='memory-op-radio', value='q95_value', options=radio_options),
-    ]),
-    html.Div(children=[
-        dcc.Graph(id='cpu-graph'),
-        dcc.RadioItems(id='cpu-op-radio', value='q95_value', options=radio_options)
-    ]),
-    html.Div(children=[
-        dcc.Graph(id='mem-line'),
-        dcc.RadioItems(id='mem-line-input', value='q95_value', options=radio_options)
-    ]),
-    html.Div(children=[
-        dcc.Graph(id='cpu-line'),
-        dcc.RadioItems(id='cpu-line-input', value='q95_value', options=radio_options)
+regression_metric_options = [
+    {'label': 'Memory (Gb)', 'value': mem_metric},
+    {'label': 'CPU %', 'value': cpu_metric},
+]
+
+regression_rank_options = [
+    {'label': 'Largest increase', 'value': 'delta'},
+    {'label': 'Largest % change', 'value': 'percent'},
+]
+
+regression_numeric = ['before', 'after', 'delta', 'change']
+regression_table_columns = [
+    {'name': 'Group', 'id': 'group'},
+    {'name': 'Namespace', 'id': 'namespace'},
+    {'name': 'From', 'id': 'from_version'},
+    {'name': 'To', 'id': 'to_version'},
+    {'name': 'Before', 'id': 'before', 'type': 'numeric'},
+    {'name': 'After', 'id': 'after', 'type': 'numeric'},
+    {'name': 'Increase', 'id': 'delta', 'type': 'numeric'},
+    {'name': '% Change', 'id': 'change', 'type': 'numeric'},
+]
+
+
+def layout():
+    return html.Div(children=[
+        dcc.Location(id='url'),
+        html.H1(children='Caliper - Basic Dashboard'),
+        html.H2(children='Net Resource Usage by an Idle 6 Node Cluster, Span 10min'),
+        html.Div(children=[
+            dcc.Graph(id='mem-group'),
+            dcc.RadioItems(id='memory-group-op-radio', value='q95_value', options=radio_options),
+            dcc.Store(id='mem-group-data'),
+        ]),
+        html.Div(children=[
+            dcc.Graph(id='memory-graph'),
+            dcc.RadioItems(id='memory-op-radio', value='q95_value', options=radio_options),
+            dcc.Store(id='memory-graph-data'),
+        ]),
+        html.Div(children=[
+            dcc.Graph(id='cpu-graph'),
+            dcc.RadioItems(id='cpu-op-radio', value='q95_value', options=radio_options),
+            dcc.Store(id='cpu-graph-data'),
+        ]),
+        html.Div(children=[
+            dcc.Graph(id='mem-line'),
+            dcc.RadioItems(id='mem-line-input', value='q95_value', options=radio_options),
+            dcc.Store(id='mem-line-data'),
+        ]),
+        html.Div(children=[
+            dcc.Graph(id='cpu-line'),
+            dcc.RadioItems(id='cpu-line-input', value='q95_value', options=radio_options),
+            dcc.Store(id='cpu-line-data'),
+        ]),
+        html.Div(children=[
+            dcc.Graph(id='run-timing'),
+        ]),
+        html.Div(children=[
+            html.H3(id='drilldown-title', children='Click a group in any chart to see its workloads'),
+            dcc.Graph(id='drilldown-graph'),
+            dcc.RadioItems(id='drilldown-op-radio', value='q95_value', options=radio_options),
+            html.Div(children=[
+                'Page ',
+                dcc.Input(id='drilldown-page', type='number', min=1, step=1, value=1, debounce=True),
+                html.Span(id='drilldown-pages'),
+            ]),
+            dcc.Store(id='drilldown-selection'),
+        ]),
+        html.Div(children=[
+            html.H3(children='Largest Regressions'),
+            dcc.RadioItems(id='regression-metric-radio', value=mem_metric, options=regression_metric_options),
+            dcc.RadioItems(id='regression-op-radio', value='q95_value', options=radio_options),
+            dcc.RadioItems(id='regression-rank-radio', value='delta', options=regression_rank_options),
+            dcc.Dropdown(id='regression-baseline', placeholder='Compared with the previous version'),
+            dash_table.DataTable(
+                id='regression-table',
+                columns=regression_table_columns,
+                sort_action='native',
+                page_size=25,
+            ),
+        ]),
     ])
-])
 
 
-@app.callback(
-    Output(component_id='mem-group', component_property='figure'),
-    Input(component_id='memory-group-op-radio', component_property='value')
-)
-def mem_group(op):
-    try:
-        df_mem = get_mem_metrics()
-        y_max = pad_range(get_max_bar_height(df_mem))
-        trim_and_group(df_mem, op)
-        return bar_group_fig(df=df_mem, op=op, y_max=y_max, title='test grouping', tick_suffix='Gb',
-                             y_title='memory', x_title='OCP Version')
-    except Exception as e:
-        print(f'mem_group: got exception type {type(e)}:\n{e}')
+charts = {}
 
 
-@app.callback(
-    Output(component_id='memory-graph', component_property='figure'),
-    Input(component_id='memory-op-radio', component_property='value')
-)
-def mem_response(op):
-    try:
-        df_mem = get_mem_metrics()
-        y_max = pad_range(get_max_bar_height(df_mem))
-        df_mem = trim_and_group(df_mem, op=op)
-        return bar_fig(df=df_mem, op=op, y_max=y_max, title='Net Memory Usage By Version', suffix='Gb',
-                       y_title='Memory (Gb)',
-                       x_title='OCP Version')
-    except Exception as e:
-        print(f'mem_response: got exception type {type(e)}:\n{e}')
+def chart(chart_id='', metric=''):
+    # registers a figure builder for chart_id, whose figures only change when metric's data does
+    def register(build):
+        charts[chart_id] = (metric, build)
+        return build
 
+    return register
 
-@app.callback(
-    Output(component_id='cpu-graph', component_property='figure'),
-    Input(component_id='cpu-op-radio', component_property='value')
-)
-def cpu_response(op):
-    try:
-        df_cpu = get_cpu_metrics()
-        y_max = pad_range(get_max_bar_height(df_cpu))
-        df_cpu = trim_and_group(df_cpu, op)
-        return bar_fig(df_cpu, op, y_max, title='CPU % by OCP Version', suffix='%',
-                       y_title='Net CPU Time in Hours', x_title='OCP Versions', legend_title='')
-    except Exception as e:
-        print(f'cpu_response: got exception type {type(e)}:\n{e}')
 
+def chart_generation(chart_id=''):
+    metric, _ = charts[chart_id]
+    refresh_groupings()
+    return data_generation(metric), group_index.generation
 
-@app.callback(
-    Output(component_id='mem-line', component_property='figure'),
-    Input(component_id='mem-line-input', component_property='value')
-)
-def mem_line_response(op):
-    try:
-        df_mem = get_mem_metrics()
-        df_mem = trim_and_group(df_mem, op)
-        y_max = pad_range(df_mem['max_value'].max())
-        return line_fig(df=df_mem, op=op, y_max=y_max, tick_suffix='Gb', title='Memory Trends by Version',
-                        y_title='Net Memory Consumed in Gigabytes', x_title='OCP Version')
-    except Exception as e:
-        print(f'mem_line_response: got exception type {type(e)}:\n{e}')
+
+def render(chart_id='', op='') -> CachedFigure:
+    _, build = charts[chart_id]
+
+    def load():
+        with instrument.stage('build_figure'):
+            fig = build(op)
+        with instrument.stage('serialize_figure'):
+            return CachedFigure(fig)
+
+    return figures.get((chart_id, op), chart_generation(chart_id), load)
+
+
+def statistics_payload(chart_id='') -> dict:
+    # the figure for the first statistic, plus for each statistic only what differs from it: the trace order and
+    # each trace's changed properties (y values, hover text...), and the changed top level layout properties.
+    base = render(chart_id, value_columns[0]).figure
+    base_traces = {t.get('name'): t for t in base['data']}
+    statistics = {}
+    for op in value_columns:
+        fig = render(chart_id, op).figure
+        traces = []
+        for t in fig['data']:
+            b = base_traces.get(t.get('name'), {})
+            traces.append([t.get('name'), {k: v for k, v in t.items() if b.get(k) != v}])
+        layout = {k: v for k, v in fig['layout'].items() if base['layout'].get(k) != v}
+        statistics[op] = {'traces': traces, 'layout': layout}
+    return {'figure': base, 'statistics': statistics}
+
+
+def render_statistics(chart_id='') -> dict:
+    return figures.get((chart_id, '*'), chart_generation(chart_id),
+                       instrument.timed('statistics_payload')(lambda: statistics_payload(chart_id)))
+
+
+@chart('mem-group', mem_metric)
+def mem_group_fig(op):
+    df_mem = get_mem_rollup()
+    y_max = pad_range(get_max_bar_height(group_sums(df_mem)))
+    return bar_group_fig(df=group_maxima(df_mem), op=op, y_max=y_max, title='test grouping', tick_suffix='Gb',
+                         y_title='memory', x_title='OCP Version')
+
+
+@chart('memory-graph', mem_metric)
+def mem_fig(op):
+    df_mem = group_sums(get_mem_rollup())
+    y_max = pad_range(get_max_bar_height(df_mem))
+    df_mem = trim_and_group(df_mem, op=op)
+    return bar_fig(df=df_mem, op=op, y_max=y_max, title='Net Memory Usage By Version', suffix='Gb',
+                   y_title='Memory (Gb)',
+                   x_title='OCP Version')
 
 
-@app.callback(
-    Output(component_id='cpu-line', component_property='figure'),
-    Input(component_id='cpu-line-input', component_property='value')
-)
-def cpu_line_response(op):
+@chart('cpu-graph', cpu_metric)
+def cpu_fig(op):
+    df_cpu = group_sums(get_cpu_rollup())
+    y_max = pad_range(get_max_bar_height(df_cpu))
+    df_cpu = trim_and_group(df_cpu, op)
+    return bar_fig(df_cpu, op, y_max, title='CPU % by OCP Version', suffix='%',
+                   y_title='Net CPU Time in Hours', x_title='OCP Versions', legend_title='')
+
+
+@chart('mem-line', mem_metric)
+def mem_line_fig(op):
+    df_mem = group_sums(get_mem_rollup())
+    df_mem = trim_and_group(df_mem, op)
+    y_max = pad_range(df_mem['max_value'].max())
+    return line_fig(df=df_mem, op=op, y_max=y_max, tick_suffix='Gb', title='Memory Trends by Version',
+                    y_title='Net Memory Consumed in Gigabytes', x_title='OCP Version')
+
+
+@chart('cpu-line', cpu_metric)
+def cpu_line_fig(op):
+    df_mem = group_sums(get_cpu_rollup())
+    df_mem = trim_and_group(df_mem, op)
+    y_max = pad_range(df_mem['max_value'].max())
+    return line_fig(df=df_mem, op=op, y_max=y_max, tick_suffix='%', title='CPU % Trends by Version',
+                    y_title='Net CPU Time in Hours', x_title='OCP Version')
+
+
+@instrument.callback('mem_group')
+def mem_group(_):
+    return render_statistics('mem-group')
+
+
+@instrument.callback('mem_response')
+def mem_response(_):
+    return render_statistics('memory-graph')
+
+
+@instrument.callback('cpu_response')
+def cpu_response(_):
+    return render_statistics('cpu-graph')
+
+
+@instrument.callback('mem_line_response')
+def mem_line_response(_):
+    return render_statistics('mem-line')
+
+
+@instrument.callback('cpu_line_response')
+def cpu_line_response(_):
+    return render_statistics('cpu-line')
+
+
+def get_run_timings() -> pd.DataFrame:
+    # a snapshot has no runner timings, only metrics
+    if db is None:
+        return timings.by_version(pd.DataFrame(columns=timings.columns))
+    with instrument.stage('query'):
+        df = db.run(timings.read)
+    instrument.rows_fetched.labels(timings.table).inc(len(df))
+    return timings.by_version(df)
+
+
+def run_timing_fig(df=pd.DataFrame(), title='', y_title='', x_title=''):
+    fig = px.bar(
+        data_frame=df,
+        x='version',
+        y='minutes',
+        color='step',
+        title=title,
+        hover_data=['runs', 'retries'],
+        category_orders={'version': versions.order_versions(df['version']), 'step': timings.steps},
+    )
+    fig.update_yaxes(go.layout.YAxis(title=y_title, ticksuffix='min', fixedrange=True))
+    fig.update_xaxes(go.layout.XAxis(title=x_title))
+    return fig
+
+
+def render_run_timing() -> CachedFigure:
+    generation = db.run(timings.generation) if db is not None else None
+
+    @instrument.timed('build_figure')
+    def load():
+        return CachedFigure(run_timing_fig(get_run_timings(), title='Runner Time by Version',
+                                           y_title='Median Minutes per Run', x_title='OCP Version'))
+
+    return figures.get(('run-timing',), generation, load)
+
+
+@instrument.callback('run_timing_response')
+def run_timing_response(_):
+    return render_run_timing().figure
+
+
+def figure_json(chart_id):
+    # serves the cached, serialized figure; clients revalidating with If-None-Match get a 304 until it changes
+    op = request.args.get('op', 'q95_value')
+    if chart_id not in charts or op not in value_columns:
+        abort(404)
+    cached = render(chart_id, op)
+    response = Response(cached.json, mimetype='application/json')
+    response.set_etag(cached.etag)
+    return response.make_conditional(request)
+
+
+def invalidate_cache():
+    known_generations.clear()
+    frames.invalidate()
+    figures.invalidate()
+    summaries.invalidate()
+    return 'ok'
+
+
+cache_collector = instrument.CacheCollector(lambda: {'frames': frames, 'figures': figures, 'summaries': summaries})
+
+
+def prometheus_metrics():
+    # Prometheus scrape endpoint: callback and stage latency histograms, rows fetched, and cache gauges
+    return Response(instrument.exposition(cache_collector), content_type=instrument.content_type)
+
+
+def cached_frames():
+    # memory held by each cached frame, e.g. for sizing PLOTTER_CACHE_ENTRIES
+    return jsonify([dict(name=name, **loader.memory_usage(df)) for (name, _), df in frames.items()])
+
+
+def warm():
+    for chart_id in charts:
+        try:
+            render_statistics(chart_id)
+        except Exception:
+            instrument.callback_errors.labels('warm').inc()
+            instrument.log.exception(f'warm {chart_id} failed')
+
+
+def on_ingest(version=''):
+    # a run was just written, render its charts now rather than on the next viewer's request
+    print(f'new results for version {version}, refreshing')
+    warm()
+
+
+def start_listener(channel=''):
+    global listener
+    listener = Listener(channel, on_ingest, **pg_connect)
+    listener.start()
+
+
+drilldown_units = {
+    mem_metric: ('Memory (Gb)', 'Gb'),
+    cpu_metric: ('CPU %', '%'),
+}
+
+
+def get_usage(metric='', group='', op='') -> drilldown.Usage:
+    # a group's per workload usage, shared by every page of its drill-down. Built from the per pod summary, which
+    # every group and op's drill-down shares
+    refresh_groupings()
+    generation = data_generation(metric)
+
+    @instrument.timed('drilldown_usage')
+    def load():
+        summary = get_summary(metric, ('version', 'group', 'pod'))
+        return drilldown.Usage(summary[summary['group'] == group], op, versions.ordered(summary))
+
+    return summaries.get((metric, 'drilldown', group, op), (generation, group_index.generation), load)
+
+
+def render_drilldown(metric='', group='', op='', page=1):
+    usage = get_usage(metric, group, op)
+    page = max(1, min(page, usage.pages(drilldown_page_size)))
+    y_title, suffix = drilldown_units[metric]
+
+    def build():
+        return CachedFigure(drilldown_fig(usage, page, drilldown_page_size, title=f'{group} by workload',
+                                          y_title=y_title, x_title='OCP Version', tick_suffix=suffix))
+
+    generation = (data_generation(metric), group_index.generation)
+    return usage, page, figures.get(('drilldown', metric, group, op, page), generation, build)
+
+
+@instrument.callback('select_group', failed=(dash.no_update, dash.no_update))
+def select_group(*args):
+    # remembers the group of the last bar or line clicked in any chart, and which metric it was charting
+    clicked = dash.callback_context.triggered[0]['prop_id'].split('.')[0]
+    chart_ids = list(charts)
+    if clicked not in chart_ids:
+        return dash.no_update, dash.no_update
+    i = chart_ids.index(clicked)
+    click, fig = args[i], args[len(chart_ids) + i]
     try:
-        df_mem = get_cpu_metrics()
-        df_mem = trim_and_group(df_mem, op)
-        y_max = pad_range(df_mem['max_value'].max())
-        return line_fig(df=df_mem, op=op, y_max=y_max, tick_suffix='%', title='CPU % Trends by Version',
-                        y_title='Net CPU Time in Hours', x_title='OCP Version')
-    except Exception as e:
-        print(f'cpu_line_response: got exception type {type(e)}:\n{e}')
+        group = fig['data'][click['points'][0]['curveNumber']]['name']
+    except (KeyError, IndexError, TypeError):
+        return dash.no_update, dash.no_update
+    return {'metric': charts[clicked][0], 'group': group}, 1
+
+
+@instrument.callback('drilldown_response', failed=(dash.no_update, dash.no_update, dash.no_update))
+def drilldown_response(selection, op, page):
+    if not selection:
+        return dash.no_update, dash.no_update, dash.no_update
+    usage, page, cached = render_drilldown(selection['metric'], selection['group'], op, int(page or 1))
+    title = f'{selection["group"]}: {len(usage)} workloads'
+    return cached.figure, f' of {usage.pages(drilldown_page_size)}', title
+
+
+@instrument.callback('regression_response', failed=(dash.no_update, dash.no_update))
+def regression_response(metric, op, rank, baseline, _):
+    matrix = get_regressions(metric)
+    if baseline not in matrix.versions:
+        baseline = None
+    with instrument.stage('regression_table'):
+        df = regression.largest(matrix, op, baseline, rank, regression_rows)
+    df[regression_numeric] = df[regression_numeric].round(3)
+    options = [{'label': f'Compared with {v}', 'value': v} for v in matrix.versions]
+    return df.to_dict('records'), options
+
+
+def register_callbacks(app):
+    for store_id, callback in [
+        ('mem-group-data', mem_group),
+        ('memory-graph-data', mem_response),
+        ('cpu-graph-data', cpu_response),
+        ('mem-line-data', mem_line_response),
+        ('cpu-line-data', cpu_line_response),
+    ]:
+        app.callback(
+            Output(component_id=store_id, component_property='data'),
+            Input(component_id='url', component_property='pathname')
+        )(callback)
+
+    # switching statistics only swaps data already in the browser, see assets/statistics.js
+    for chart_id, radio_id in [
+        ('mem-group', 'memory-group-op-radio'),
+        ('memory-graph', 'memory-op-radio'),
+        ('cpu-graph', 'cpu-op-radio'),
+        ('mem-line', 'mem-line-input'),
+        ('cpu-line', 'cpu-line-input'),
+    ]:
+        app.clientside_callback(
+            ClientsideFunction(namespace='caliper', function_name='select_statistic'),
+            Output(component_id=chart_id, component_property='figure'),
+            Input(component_id=radio_id, component_property='value'),
+            Input(component_id=f'{chart_id}-data', component_property='data'),
+        )
+
+    app.callback(
+        [
+            Output(component_id='drilldown-selection', component_property='data'),
+            Output(component_id='drilldown-page', component_property='value'),
+        ],
+        [Input(component_id=chart_id, component_property='clickData') for chart_id in charts],
+        [State(component_id=chart_id, component_property='figure') for chart_id in charts],
+    )(select_group)
+    app.callback(
+        [
+            Output(component_id='drilldown-graph', component_property='figure'),
+            Output(component_id='drilldown-pages', component_property='children'),
+            Output(component_id='drilldown-title', component_property='children'),
+        ],
+        Input(component_id='drilldown-selection', component_property='data'),
+        Input(component_id='drilldown-op-radio', component_property='value'),
+        Input(component_id='drilldown-page', component_property='value'),
+    )(drilldown_response)
+
+    app.callback(
+        Output(component_id='run-timing', component_property='figure'),
+        Input(component_id='url', component_property='pathname'),
+    )(run_timing_response)
+
+    app.callback(
+        [
+            Output(component_id='regression-table', component_property='data'),
+            Output(component_id='regression-baseline', component_property='options'),
+        ],
+        Input(component_id='regression-metric-radio', component_property='value'),
+        Input(component_id='regression-op-radio', component_property='value'),
+        Input(component_id='regression-rank-radio', component_property='value'),
+        Input(component_id='regression-baseline', component_property='value'),
+        Input(component_id='url', component_property='pathname'),
+    )(regression_response)
+
+    app.server.add_url_rule('/figures/<chart_id>', view_func=figure_json)
+    app.server.add_url_rule('/cache/invalidate', view_func=invalidate_cache, methods=['POST'])
+    app.server.add_url_rule('/cache/frames', view_func=cached_frames)
+    app.server.add_url_rule('/metrics', view_func=prometheus_metrics)
+    if os.getenv('PLOTTER_REQUEST_LOG', '').lower() in ('1', 'true', 'yes'):
+        # one JSON line per request, with the time spent in each stage, see instrument.log_request()
+        app.server.before_request(instrument.start_request)
+        app.server.after_request(instrument.log_request)
+
+
+def create_app(preload=False, listen=True):
+    """
+    Build the dashboard, e.g. create_app().run_server() or a WSGI server serving create_app().server.
+
+    With preload, every chart is rendered before returning and the connection pool emptied, so a pre-forking server
+    (see gunicorn.conf.py) shares the loaded frames and figures copy-on-write with its workers, none of which inherits
+    a database connection.  Forked workers should call after_fork() rather than listen here, as threads do not
+    survive a fork.
+    """
+    started = time.perf_counter()
+    init()
+    initialized = time.perf_counter()
+    app = dash.Dash(__name__, external_stylesheets=['./style.css'])
+    app.layout = layout()
+    register_callbacks(app)
+    built = time.perf_counter()
+    if preload:
+        warm()
+        if db is not None:
+            db.close()
+    warmed = time.perf_counter()
+    if listen:
+        after_fork()
+
+    elapsed = warmed - started
+    print(f'startup took {elapsed:.2f}s: init {initialized - started:.2f}s, app {built - initialized:.2f}s, '
+          f'preload {warmed - built:.2f}s')
+    budget = float(os.getenv('PLOTTER_STARTUP_BUDGET_SECONDS', '30'))
+    if elapsed > budget:
+        print(f'startup exceeded its {budget:.0f}s budget (PLOTTER_STARTUP_BUDGET_SECONDS)')
+    return app
+
+
+def after_fork():
+    # per process setup that cannot be inherited from a preloading parent
+    if notify_channel and db is not None:
+        start_listener(notify_channel)
 
 
 if __name__ == '__main__':
-    app.run_server(debug=True, port=8050, host='0.0.0.0')
+    create_app().run_server(debug=True, port=8050, host='0.0.0.0')
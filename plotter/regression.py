@@ -0,0 +1,116 @@
+import numpy
+import pandas as pd
+
+value_columns = ['q95_value', 'avg_value', 'min_value', 'max_value']
+
+# a regression is tracked per namespace, within the group it's charted under
+keys = ['group', 'namespace']
+
+table_columns = ['group', 'namespace', 'from_version', 'to_version', 'before', 'after', 'delta', 'change']
+
+
+class Matrix:
+    """
+    Version ordered usage per key: values[s, i, j] is statistic columns[s] of key i (a group and namespace) in
+    version j, NaN where the key has no rows in that version.
+
+    Built from aggregation.summarize() output keyed by version and keys.  update() replaces or inserts only the
+    columns of the versions it's given, so a new run costs a summary of its own rows and one more column.
+    """
+
+    def __init__(self, summary=pd.DataFrame(), version_order=(), columns=value_columns):
+        self.columns = list(columns)
+        self.keys = pd.MultiIndex.from_arrays([[]] * len(keys), names=keys)
+        self.versions = []
+        self.rows = numpy.zeros(0, dtype='int64')
+        self.values = numpy.full((len(self.columns), 0, 0), numpy.nan)
+        self._set(summary, version_order)
+
+    def _set(self, summary=pd.DataFrame(), version_order=()):
+        # places summary's versions, replacing their old columns, and reorders all columns into version_order
+        version_order = [str(v) for v in version_order]
+        summary_keys = pd.MultiIndex.from_frame(summary[keys].astype(str))
+        new_keys = self.keys.append(summary_keys.unique().difference(self.keys)) if len(summary_keys) else self.keys
+        replaced = set(str(v) for v in pd.unique(summary['version']))
+
+        values = numpy.full((len(self.columns), len(new_keys), len(version_order)), numpy.nan)
+        rows = numpy.zeros(len(version_order), dtype='int64')
+        position = {v: j for j, v in enumerate(version_order)}
+        kept = [(i, position[v]) for i, v in enumerate(self.versions) if v in position and v not in replaced]
+        if kept:
+            old, new = (list(c) for c in zip(*kept))
+            values[:, :len(self.keys), new] = self.values[:, :, old]
+            rows[new] = self.rows[old]
+
+        key_codes = new_keys.get_indexer(summary_keys)
+        version_codes = pd.Categorical(summary['version'].astype(str), categories=version_order).codes
+        present = version_codes >= 0
+        values[:, key_codes[present], version_codes[present]] = \
+            summary[self.columns].values[present].astype('float64').T
+        rows += numpy.bincount(version_codes[present], weights=summary['rows'].values[present],
+                               minlength=len(version_order)).astype('int64')
+
+        self.keys = new_keys
+        self.versions = version_order
+        self.rows = rows
+        self.values = values
+
+    def update(self, summary=pd.DataFrame(), version_order=()) -> 'Matrix':
+        # a copy with summary's versions (re)placed. Cached matrices are shared, so this never modifies self
+        matrix = Matrix.__new__(Matrix)
+        matrix.__dict__.update(self.__dict__)
+        matrix._set(summary, version_order)
+        return matrix
+
+    def __len__(self):
+        return len(self.keys)
+
+    def changes(self, op='', baseline=None):
+        """
+        (before, after, from_version, to_version) arrays, each keys x versions, for every version compared either
+        with the key's previous version with rows or with the baseline version.
+        """
+        v = self.values[self.columns.index(op)]
+        n = len(self.versions)
+        if baseline is not None:
+            base = self.versions.index(baseline)
+            source = numpy.full(v.shape, base)
+        else:
+            # position of the latest version with rows, up to and excluding each column
+            present = numpy.where(numpy.isnan(v), -1, numpy.arange(n))
+            latest = numpy.maximum.accumulate(present, axis=1)
+            source = numpy.concatenate([numpy.full((len(v), 1), -1), latest[:, :-1]], axis=1)
+        before = numpy.take_along_axis(v, source.clip(min=0), axis=1)
+        before[source < 0] = numpy.nan
+        return before, v, source, numpy.broadcast_to(numpy.arange(n), v.shape)
+
+
+def largest(matrix=None, op='', baseline=None, rank='delta', limit=50) -> pd.DataFrame:
+    """
+    The limit largest increases of op between versions, largest first, ranked by delta or by percent change.
+
+    Without a baseline each version is compared with the key's previous version, otherwise with the baseline's.
+    """
+    before, after, source, target = matrix.changes(op, baseline)
+    delta = after - before
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        change = numpy.where(before != 0, delta / numpy.abs(before) * 100, numpy.nan)
+    score = (delta if rank == 'delta' else change).ravel()
+    candidates = numpy.flatnonzero(score > 0)
+    if len(candidates) > limit:
+        candidates = candidates[numpy.argpartition(-score[candidates], limit - 1)[:limit]]
+    candidates = candidates[numpy.argsort(-score[candidates], kind='stable')]
+
+    key, version = numpy.unravel_index(candidates, delta.shape)
+    versions = numpy.array(matrix.versions, dtype=object)
+    df = pd.DataFrame({
+        'group': matrix.keys.get_level_values('group')[key],
+        'namespace': matrix.keys.get_level_values('namespace')[key],
+        'from_version': versions[source[key, version]] if len(key) else [],
+        'to_version': versions[target[key, version]] if len(key) else [],
+        'before': before[key, version],
+        'after': after[key, version],
+        'delta': delta[key, version],
+        'change': change[key, version],
+    }, columns=table_columns)
+    return df
@@ -0,0 +1,147 @@
+"""
+Static HTML report of every dashboard chart and statistic, for publishing as a CI build artifact without a Dash server.
+
+    python report.py --output build/report
+
+The charts' data is loaded once, then their figures are rendered by a pool of processes forked from the loader, which
+share the loaded frames copy-on-write.  Each chart and statistic is rendered to its own fragment and the versions it
+was rendered from are kept in report.json, so re-running only re-renders the charts whose metric gained, lost or
+changed versions (or whose groupings changed).  index.html embeds plotly.js and every fragment, and needs nothing else
+to be viewed.
+"""
+import argparse
+import hashlib
+import html
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from plotly.offline import get_plotlyjs
+
+import main
+
+state_file = 'report.json'
+report_file = 'index.html'
+fragments_dir = 'fragments'
+format_version = 1
+
+
+def input_versions(metric='') -> dict:
+    # {version: [rows, max(query_time)]} of the rows the metric's charts are built from
+    grouped = main.get_rollup(metric).groupby('version', observed=True)
+    rows = grouped['rows'].sum()
+    last = grouped['last_query_time'].max()
+    return {str(v): [int(rows[v]), str(last[v])] for v in rows.index}
+
+
+def groupings_digest():
+    with open(main.group_index.path, 'rb') as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+
+def load_state(directory=''):
+    path = os.path.join(directory, state_file)
+    if os.path.exists(path):
+        with open(path, 'r') as file:
+            state = json.load(file)
+        if state.get('format') == format_version:
+            return state
+    return {'format': format_version, 'charts': {}}
+
+
+def _write(path='', text=''):
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as file:
+        file.write(text)
+    os.replace(tmp, path)
+
+
+def render_fragment(chart_id='', op='', path=''):
+    # runs in a forked worker: the chart's frames are already in main.frames and its generation pinned
+    _, build = main.charts[chart_id]
+    _write(path, build(op).to_html(full_html=False, include_plotlyjs=False))
+    return chart_id, op
+
+
+def fragment_file(chart_id='', op=''):
+    return os.path.join(fragments_dir, f'{chart_id}.{op}.html')
+
+
+def assemble(directory='', title=''):
+    statistics = [(o['value'], o['label']) for o in main.radio_options]
+    body = []
+    for chart_id in main.charts:
+        body.append(f'<h2>{html.escape(chart_id)}</h2>')
+        for op, label in statistics:
+            with open(os.path.join(directory, fragment_file(chart_id, op)), 'r') as file:
+                body.append(f'<h3>{html.escape(label)}</h3>\n{file.read()}')
+    _write(os.path.join(directory, report_file), '\n'.join([
+        '<!DOCTYPE html>',
+        '<html>',
+        f'<head><meta charset="utf-8"><title>{html.escape(title)}</title>',
+        f'<script type="text/javascript">{get_plotlyjs()}</script></head>',
+        f'<body><h1>{html.escape(title)}</h1>',
+    ] + body + ['</body>', '</html>']))
+
+
+def build(directory='', workers=None, force=False, title='Caliper Report'):
+    """
+    Create or update the report in directory, re-rendering only charts whose inputs changed (or all, with force).
+
+    Returns the ids of the charts rendered.
+    """
+    main.init()
+    main.refresh_groupings()
+    os.makedirs(os.path.join(directory, fragments_dir), exist_ok=True)
+    state = load_state(directory)
+
+    groupings = groupings_digest()
+    inputs = {}
+    for metric in {metric for metric, _ in main.charts.values()}:
+        main.pinned_generations[metric] = main.data_generation(metric)
+        inputs[metric] = {'versions': input_versions(metric), 'groupings': groupings}
+
+    stale = []
+    for chart_id, (metric, _) in main.charts.items():
+        previous = state['charts'].get(chart_id, {})
+        missing = any(not os.path.exists(os.path.join(directory, fragment_file(chart_id, op)))
+                      for op in main.value_columns)
+        if force or missing or previous.get('inputs') != inputs[metric]:
+            stale.append(chart_id)
+
+    if stale:
+        # workers inherit the loaded frames, but must not share the loader's database connections
+        if main.db is not None:
+            main.db.close()
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork'))
+        with pool:
+            jobs = [pool.submit(render_fragment, chart_id, op, os.path.join(directory, fragment_file(chart_id, op)))
+                    for chart_id in stale for op in main.value_columns]
+            for job in jobs:
+                job.result()
+        for chart_id in stale:
+            metric, _ = main.charts[chart_id]
+            state['charts'][chart_id] = {'metric': metric, 'inputs': inputs[metric]}
+
+    for chart_id in set(state['charts']) - set(main.charts):
+        del state['charts'][chart_id]
+    assemble(directory, title)
+    _write(os.path.join(directory, state_file), json.dumps(state, indent=1, sort_keys=True))
+    return stale
+
+
+def set_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--output', type=str, required=True, help='report directory, created or updated')
+    parser.add_argument('--workers', type=int, default=None, help='rendering processes (default: one per cpu)')
+    parser.add_argument('--force', action='store_true', help='re-render every chart')
+    parser.add_argument('--title', type=str, default='Caliper Report')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = set_args()
+    rendered = build(args.output, args.workers, args.force, args.title)
+    print(f'rendered {len(rendered)} of {len(main.charts)} charts: {", ".join(rendered) or "none changed"}')
+    print(os.path.join(args.output, report_file))
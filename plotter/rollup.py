@@ -0,0 +1,68 @@
+import os
+
+import pandas as pd
+from psycopg2.extras import execute_values
+
+view = 'caliper_group_rollup'
+groups_table = 'caliper_namespace_groups'
+
+_ddl_file = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'sql', 'rollup.sql')
+
+
+def install(conn, rules):
+    # idempotent; creates the group table and rollup view if missing, then (re)loads the namespace rules
+    with open(_ddl_file, 'r') as file:
+        ddl = file.read()
+    with conn.cursor() as cur:
+        cur.execute(ddl)
+    conn.commit()
+    sync_groups(conn, rules)
+
+
+def sync_groups(conn, rules):
+    # rules are (pattern, group, priority) rows, see groupings.GroupIndex.rules()
+    with conn.cursor() as cur:
+        cur.execute(f'DELETE FROM {groups_table};')
+        execute_values(cur, f'INSERT INTO {groups_table} (pattern, grp, priority) VALUES %s;', rules)
+    conn.commit()
+    refresh(conn)
+
+
+def refresh(conn):
+    with conn.cursor() as cur:
+        # a full recompute may legitimately outlast the dashboard's statement timeout
+        cur.execute('SET LOCAL statement_timeout = 0;')
+        cur.execute(f'REFRESH MATERIALIZED VIEW CONCURRENTLY {view};')
+    conn.commit()
+
+
+def generation(conn, metric=''):
+    # the (row count, max query_time) of the raw rows the rollup was last computed from
+    with conn.cursor() as cur:
+        cur.execute(f'SELECT sum(rows)::bigint, max(last_query_time) FROM {view} WHERE metric = %s;', (metric,))
+        gen = cur.fetchone()
+    conn.commit()
+    if gen[0] is None:
+        return 0, None
+    return gen
+
+
+def read(conn, metric='', since=None, float_dtype='float64') -> pd.DataFrame:
+    # with since, only the rows of versions that gained raw rows after that query_time
+    query = f'SELECT * FROM {view} WHERE metric = %s'
+    params = (metric,)
+    if since is not None:
+        query += ' AND version IN (SELECT version FROM caliper_metrics WHERE metric = %s AND query_time > %s)'
+        params += (metric, since)
+    with conn.cursor() as cur:
+        cur.execute(query + ';', params)
+        columns = [col[0] for col in cur.description]
+        rows = cur.fetchall()
+    conn.commit()
+    df = pd.DataFrame(rows, columns=columns)
+    for c in df.columns:
+        if c.endswith('_value') or c.endswith('_value_max'):
+            df[c] = df[c].astype(float_dtype)
+        elif df[c].dtype == object:
+            df[c] = df[c].astype('category')
+    return df
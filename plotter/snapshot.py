@@ -0,0 +1,224 @@
+"""
+Columnar snapshots of caliper_metrics, for serving dashboards without a database.
+
+A snapshot is a directory of Arrow IPC files, one per metric and version, plus a manifest:
+
+    manifest.json
+    raw/<metric>/<version>.arrow        caliper_metrics rows
+    rollup/<metric>/<version>.arrow     optional per namespace sums and maxima, see aggregate()
+
+Files are memory-mapped when read, so only the pages of the requested columns and versions are ever read from disk.
+The frames built from them are ordinary pandas frames, copied out of the mapping (each version is its own chunk, and
+a pandas column must be contiguous), so processes don't share them; a pre-forking server shares what its master
+loaded copy-on-write instead.  Exports are incremental: only versions whose row count or max(query_time) changed
+since the last export are rewritten.
+
+    python snapshot.py --output /srv/caliper-snapshot
+"""
+import argparse
+import json
+import os
+from urllib.parse import quote
+
+import pandas as pd
+import pyarrow as pa
+from pyarrow import ipc
+
+import loader
+
+manifest_file = 'manifest.json'
+format_version = 1
+
+value_columns = ['q95_value', 'avg_value', 'min_value', 'max_value']
+max_columns = [f'{v}_max' for v in value_columns]
+
+
+def aggregate(df=pd.DataFrame(), by='namespace') -> pd.DataFrame:
+    # per (version, metric, by) sums and maxima of raw rows, with the columns of the rollup view (sql/rollup.sql)
+    grouped = df.groupby(['version', 'metric', by], observed=True, sort=False)
+    out = grouped[value_columns].sum()
+    out[max_columns] = grouped[value_columns].max().values
+    out['rows'] = grouped.size()
+    out['last_query_time'] = grouped['query_time'].max()
+    return out.reset_index()
+
+
+def regroup(df=pd.DataFrame(), assign=None, float_dtype='float64') -> pd.DataFrame:
+    # per namespace aggregates -> per group, assign(namespaces) being groupings.GroupIndex.assign
+    df = df.assign(group=assign(df['namespace']))
+    grouped = df.groupby(['version', 'metric', 'group'], observed=True, sort=False)
+    out = grouped[value_columns + ['rows']].sum()
+    out[max_columns + ['last_query_time']] = grouped[max_columns + ['last_query_time']].max()
+    out = out.reset_index()
+    for c in value_columns + max_columns:
+        out[c] = out[c].astype(float_dtype)
+    return out
+
+
+def _write(path, df=pd.DataFrame()):
+    # text columns are stored as plain strings and come back as categoricals, see Snapshot.read()
+    for c in df.columns:
+        if hasattr(df[c], 'cat'):
+            df[c] = df[c].astype(object)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.tmp'
+    with pa.OSFile(tmp, 'wb') as sink, ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp, path)
+
+
+def _stats(conn, metric=''):
+    # {version: (rows, max(query_time))} as stored in the manifest
+    with conn.cursor() as cur:
+        cur.execute('SELECT version, count(*), max(query_time) FROM caliper_metrics WHERE metric = %s GROUP BY version;',
+                    (metric,))
+        rows = cur.fetchall()
+    return {v: (n, str(last)) for v, n, last in rows}
+
+
+def export(conn, directory='', metrics=(), pre_aggregate=True, versions=None):
+    """
+    Write or update the snapshot in directory with the rows of metrics, optionally only of the given versions.
+    """
+    path = os.path.join(directory, manifest_file)
+    manifest = {'format': format_version, 'metrics': {}}
+    if os.path.exists(path):
+        with open(path, 'r') as file:
+            manifest = json.load(file)
+
+    for metric in metrics:
+        entry = manifest['metrics'].setdefault(metric, {'raw': {}, 'rollup': {}})
+        stats = _stats(conn, metric)
+        if versions is not None:
+            stats = {v: s for v, s in stats.items() if v in versions}
+        else:
+            for removed in set(entry['raw']) - set(stats):
+                for kind in ('raw', 'rollup'):
+                    if removed in entry[kind]:
+                        os.remove(os.path.join(directory, entry[kind].pop(removed)['file']))
+        changed = [v for v, (rows, last) in stats.items()
+                   if entry['raw'].get(v, {}).get('rows') != rows or entry['raw'][v]['last_query_time'] != last
+                   or (pre_aggregate and v not in entry['rollup'])]
+        if not changed:
+            continue
+        df = loader.read_frame(conn, 'SELECT * FROM caliper_metrics WHERE metric = %s AND version = ANY(%s);',
+                               (metric, changed))
+        for version, raw in df.groupby('version', observed=True):
+            rows, last = stats[version]
+            name = f'{quote(version, safe="")}.arrow'
+            files = {'raw': (raw, f'raw/{quote(metric, safe="")}/{name}')}
+            if pre_aggregate:
+                files['rollup'] = (aggregate(raw), f'rollup/{quote(metric, safe="")}/{name}')
+            elif version in entry['rollup']:
+                # its rows changed, so the old aggregates are wrong
+                os.remove(os.path.join(directory, entry['rollup'].pop(version)['file']))
+            for kind, (frame, file) in files.items():
+                _write(os.path.join(directory, file), frame.copy())
+                entry[kind][version] = {'file': file, 'rows': rows, 'last_query_time': last}
+
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as file:
+        json.dump(manifest, file, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+    return manifest
+
+
+class Snapshot:
+    """
+    Read-only view of a snapshot directory, reloading its manifest whenever an export replaces it.
+    """
+
+    def __init__(self, directory=''):
+        self.directory = directory
+        self._mtime = None
+        self._metrics = {}
+        self.reload_if_changed()
+
+    def reload_if_changed(self) -> bool:
+        path = os.path.join(self.directory, manifest_file)
+        mtime = os.stat(path).st_mtime_ns
+        if mtime == self._mtime:
+            return False
+        with open(path, 'r') as file:
+            manifest = json.load(file)
+        if manifest.get('format') != format_version:
+            raise ValueError(f'{path}: unsupported snapshot format {manifest.get("format")}')
+        self._metrics = manifest['metrics']
+        self._mtime = mtime
+        return True
+
+    def versions(self, metric='', kind='raw', since=None) -> dict:
+        # the manifest entries of the metric's versions, with since only those with rows after that query_time
+        entries = self._metrics.get(metric, {}).get(kind, {})
+        if since is None:
+            return dict(entries)
+        since = str(since)
+        return {v: e for v, e in entries.items() if e['last_query_time'] > since}
+
+    def generation(self, metric=''):
+        # same shape as main.data_generation(): (rows, max(query_time))
+        self.reload_if_changed()
+        entries = self.versions(metric).values()
+        if not entries:
+            return 0, None
+        return sum(e['rows'] for e in entries), max(e['last_query_time'] for e in entries)
+
+    def has_rollup(self, metric=''):
+        return set(self.versions(metric, 'rollup')) >= set(self.versions(metric))
+
+    def read(self, metric='', kind='raw', columns=None, since=None) -> pd.DataFrame:
+        """
+        Concatenate the metric's version files, only reading the given columns.
+
+        Text columns come back as categoricals, numbers as float64 and query_time as datetime64.  With since, only
+        versions that gained rows after that query_time are read, and of those only the newer rows for kind='raw'.
+        """
+        tables = []
+        for entry in self.versions(metric, kind, since).values():
+            # no close(): the table's buffers point into the mapping
+            table = ipc.open_file(pa.memory_map(os.path.join(self.directory, entry['file']), 'r')).read_all()
+            tables.append(table.select(columns) if columns else table)
+        if not tables:
+            return pd.DataFrame(columns=columns or [])
+        df = pa.concat_tables(tables).to_pandas(strings_to_categorical=True)
+        if since is not None and kind == 'raw' and 'query_time' in df.columns:
+            df = df[df['query_time'] > pd.Timestamp(since)].reset_index(drop=True)
+        return df
+
+
+def set_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--output', type=str, required=True, help='snapshot directory, created or updated')
+    parser.add_argument('--metric', type=str, action='append', help='metrics to export (default: all)')
+    parser.add_argument('--version', type=str, action='append', help='only export these versions')
+    parser.add_argument('--no-rollup', action='store_true', help='skip the per namespace pre-aggregates')
+    return parser.parse_args()
+
+
+def main():
+    import psycopg2
+    from dotenv import load_dotenv
+
+    args = set_args()
+    load_dotenv()
+    conn = psycopg2.connect(
+        host=os.getenv('PGHOST'),
+        port=os.getenv('PGPORT'),
+        database=os.getenv('PGDATABASE'),
+        user=os.getenv('PGUSER'),
+        password=os.getenv('PGPASSWORD')
+    )
+    metrics = args.metric
+    if not metrics:
+        with conn.cursor() as cur:
+            cur.execute('SELECT DISTINCT metric FROM caliper_metrics;')
+            metrics = [m for m, in cur.fetchall()]
+    manifest = export(conn, args.output, metrics, pre_aggregate=not args.no_rollup, versions=args.version)
+    conn.close()
+    for metric, entry in manifest['metrics'].items():
+        print(f'{metric}: {len(entry["raw"])} versions, {sum(e["rows"] for e in entry["raw"].values())} rows')
+
+
+if __name__ == '__main__':
+    main()
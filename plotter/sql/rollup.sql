@@ -0,0 +1,61 @@
+-- Per (version, metric, group) rollup of caliper_metrics, read by the plotter instead of raw pod rows.
+-- caliper_namespace_groups is generated from component-mappings.yaml by the plotter. Each rule is a LIKE pattern,
+-- exact namespaces being escaped literals, and the matching rule with the lowest priority wins. Namespaces matching
+-- no rule are rolled into the 'other' group.
+
+-- Databases set up before groupings took glob patterns have a (namespace, grp) table, and a view built on it. Both are
+-- regenerated from component-mappings.yaml, so they're dropped to be recreated below.
+DO
+$$
+    BEGIN
+        IF EXISTS(SELECT 1
+                  FROM information_schema.columns
+                  WHERE table_schema = current_schema()
+                    AND table_name = 'caliper_namespace_groups'
+                    AND column_name = 'namespace') THEN
+            DROP MATERIALIZED VIEW IF EXISTS caliper_group_rollup;
+            DROP TABLE caliper_namespace_groups;
+        END IF;
+    END
+$$;
+
+CREATE TABLE IF NOT EXISTS caliper_namespace_groups
+(
+    pattern  text PRIMARY KEY,
+    grp      text NOT NULL,
+    priority int  NOT NULL
+);
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS caliper_group_rollup AS
+WITH namespace_group AS (
+    SELECT ns.namespace,
+           coalesce((SELECT g.grp
+                     FROM caliper_namespace_groups g
+                     WHERE ns.namespace LIKE g.pattern
+                     ORDER BY g.priority, g.grp
+                     LIMIT 1), 'other') AS grp
+    FROM (SELECT DISTINCT namespace FROM caliper_metrics) ns
+)
+SELECT m.version,
+       m.metric,
+       ng.grp                AS "group",
+       count(*)              AS rows,
+       max(m.query_time)     AS last_query_time,
+       sum(m.q95_value)      AS q95_value,
+       sum(m.avg_value)      AS avg_value,
+       sum(m.min_value)      AS min_value,
+       sum(m.max_value)      AS max_value,
+       max(m.q95_value)      AS q95_value_max,
+       max(m.avg_value)      AS avg_value_max,
+       max(m.min_value)      AS min_value_max,
+       max(m.max_value)      AS max_value_max
+FROM caliper_metrics m
+         JOIN namespace_group ng ON ng.namespace = m.namespace
+GROUP BY m.version, m.metric, ng.grp;
+
+-- required for REFRESH ... CONCURRENTLY, which lets the dashboard keep reading during a refresh
+CREATE UNIQUE INDEX IF NOT EXISTS caliper_group_rollup_key
+    ON caliper_group_rollup (version, metric, "group");
+
+CREATE INDEX IF NOT EXISTS caliper_metrics_metric_query_time
+    ON caliper_metrics (metric, query_time);
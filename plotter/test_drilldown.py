@@ -0,0 +1,43 @@
+import pandas as pd
+
+import aggregation
+import drilldown
+
+
+def pods(group='', workloads=0, replicas=2):
+    # replicas pods per workload, named like a deployment's
+    return [(group, f'{group}-{w}-7c9d8b4f6-bxkz{drilldown._alphabet[r]}') for w in range(workloads) for r in range(replicas)]
+
+
+def frame(versions=('4.6.1', '4.7.0')):
+    rows = pods('apiserver', 3) + pods('networking', 40)
+    df = pd.DataFrame([(v, g, p) for v in versions for g, p in rows], columns=['version', 'group', 'pod'])
+    for c in aggregation.value_columns:
+        df[c] = 1.0
+    for c in ['version', 'group', 'pod']:
+        df[c] = df[c].astype('category')
+    return df
+
+
+def test_workload_name():
+    assert drilldown.workload_name('machine-approver-fd55d58bb-mpcrr') == 'machine-approver'
+    assert drilldown.workload_name('controller-manager-c28hw') == 'controller-manager'
+    assert drilldown.workload_name('kube-proxy') == 'kube-proxy'
+    assert drilldown.workload_name('etcd-master-0') == 'etcd-master-0'
+
+
+def test_one_group_of_many():
+    df = frame()
+    usage = drilldown.Usage(df[df['group'] == 'apiserver'], 'q95_value', ['4.6.1', '4.7.0'])
+    assert sorted(usage.names) == ['apiserver-0', 'apiserver-1', 'apiserver-2']
+    assert usage.pages(2) == 2
+    assert usage.matrix.tolist() == [[2.0, 2.0]] * 3
+    assert usage.page(1, 2)[-1][0] == f'{drilldown.other} (1 workloads)'
+
+
+def test_one_group_of_summary():
+    summary = aggregation.summarize(frame(), ('version', 'group', 'pod'))
+    usage = drilldown.Usage(summary[summary['group'] == 'apiserver'], 'q95_value', ['4.6.1', '4.7.0'])
+    assert len(usage) == 3
+    assert usage.pages(20) == 1
+    assert usage.page(1, 20)[-1][0] == 'apiserver-2'
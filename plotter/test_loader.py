@@ -0,0 +1,72 @@
+from collections import namedtuple
+
+import pytest
+
+import loader
+
+Column = namedtuple('Column', ['name', 'type_code'])
+
+
+class FakeConnection:
+    """
+    Answers read_frame's queries: the column description, then csv written to the COPY stream.  With fail_after set,
+    the COPY raises once it has written that many bytes.
+    """
+
+    def __init__(self, columns=(), csv=b'', fail_after=None):
+        self.description = [Column(*c) for c in columns]
+        self.csv = csv
+        self.fail_after = fail_after
+
+    def cursor(self):
+        return FakeCursor(self)
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.description = conn.description
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def mogrify(self, query, params=None):
+        return query.encode()
+
+    def execute(self, query, params=None):
+        pass
+
+    def copy_expert(self, sql, file, size=8192):
+        if self.conn.fail_after is None:
+            file.write(self.conn.csv)
+            return
+        file.write(self.conn.csv[:self.conn.fail_after])
+        raise ConnectionError('server closed the connection unexpectedly')
+
+
+columns = [('version', 25), ('value', 701)]
+
+
+def test_read_frame():
+    df = loader.read_frame(FakeConnection(columns, b'4.6.1,1.5\n4.7.0,\n'), 'SELECT version, value FROM t')
+    assert list(df['version']) == ['4.6.1', '4.7.0']
+    assert str(df['version'].dtype) == 'category'
+    assert df['value'].iloc[0] == 1.5
+    assert df['value'].isna().iloc[1]
+
+
+def test_malformed_row():
+    # enough rows after the bad one that the producer is still writing when the parse fails, and breaks its pipe
+    csv = b'4.6.1,1.5\n4.7.0,not a number\n' + b'4.8.0,2.5\n' * 500000
+    with pytest.raises(ValueError) as raised:
+        loader.read_frame(FakeConnection(columns, csv), 'SELECT version, value FROM t')
+    assert isinstance(raised.value.__cause__, BrokenPipeError)
+
+
+def test_failed_copy():
+    csv = b'4.6.1,1.5\n4.7.0,2.5\n'
+    with pytest.raises(ConnectionError):
+        loader.read_frame(FakeConnection(columns, csv, fail_after=len(b'4.6.1,1.5\n')), 'SELECT version, value FROM t')
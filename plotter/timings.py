@@ -0,0 +1,50 @@
+import pandas as pd
+
+# written by the runner for every step it runs, see runner/telemetry.py
+table = 'caliper_run_steps'
+
+# a run's steps in the order they're taken, which is also how they're stacked
+steps = ['fetch', 'configure', 'create', 'settle', 'login', 'collect', 'destroy']
+
+columns = ['version', 'run_id', 'step', 'seconds', 'retries']
+
+
+def generation(conn):
+    # (rows, last finished_at), or (0, None) before the runner has created the table
+    with conn.cursor() as cur:
+        cur.execute('SELECT to_regclass(%s) IS NOT NULL;', (table,))
+        if not cur.fetchone()[0]:
+            conn.commit()
+            return 0, None
+        cur.execute(f'SELECT count(*), max(finished_at) FROM {table};')
+        gen = cur.fetchone()
+    conn.commit()
+    return gen
+
+
+def read(conn) -> pd.DataFrame:
+    # the successful steps of every run
+    with conn.cursor() as cur:
+        cur.execute('SELECT to_regclass(%s) IS NOT NULL;', (table,))
+        rows = []
+        if cur.fetchone()[0]:
+            cur.execute(f'SELECT {", ".join(columns)} FROM {table} WHERE ok;')
+            rows = cur.fetchall()
+    conn.commit()
+    df = pd.DataFrame(rows, columns=columns)
+    df['seconds'] = df['seconds'].astype('float64')
+    return df
+
+
+def by_version(df=pd.DataFrame()) -> pd.DataFrame:
+    """
+    Median minutes each step took per version over the runs that completed it, how many runs that was and their most
+    retries.  Steps are an ordered categorical, in the order they're taken.
+    """
+    grouped = df.groupby(['version', 'step'], observed=True)
+    summary = grouped['seconds'].median().div(60).rename('minutes').to_frame()
+    summary['runs'] = grouped['run_id'].nunique()
+    summary['retries'] = grouped['retries'].max()
+    summary = summary.reset_index()
+    summary['step'] = pd.Categorical(summary['step'], categories=steps, ordered=True)
+    return summary
@@ -0,0 +1,49 @@
+import numpy
+import pandas as pd
+import semver
+
+latest = 'latest'
+
+
+def version_key(version=''):
+    # semver versions (pre-releases before their release) < anything unparseable, by name < 'latest'
+    if version == latest:
+        return 2, None, version
+    try:
+        return 0, semver.VersionInfo.parse(version), version
+    except (ValueError, TypeError):
+        return 1, None, str(version)
+
+
+def order_versions(versions) -> list:
+    return sorted(set(versions), key=version_key)
+
+
+def version_dtype(versions) -> pd.CategoricalDtype:
+    return pd.CategoricalDtype(categories=order_versions(versions), ordered=True)
+
+
+def index_versions(df=pd.DataFrame(), column='version') -> pd.DataFrame:
+    """
+    Make df[column] an ordered categorical over its distinct versions, in version order.
+
+    Only the distinct values are parsed, so sorting by or grouping on the column afterwards never touches semver
+    again.  Done once when a frame is loaded; group with observed=True to skip versions absent from a subset.
+    """
+    values = df[column]
+    if hasattr(values, 'cat'):
+        distinct = [v for v in values.cat.categories if v is not None]
+        df[column] = values.cat.set_categories(order_versions(distinct), ordered=True)
+    else:
+        df[column] = values.astype(version_dtype(pd.unique(values.dropna())))
+    return df
+
+
+def ordered(df=pd.DataFrame(), column='version') -> list:
+    # the versions present in df, in version order
+    values = df[column]
+    if hasattr(values, 'cat') and values.cat.ordered:
+        # categories are in version order, so the sorted distinct codes are too
+        codes = numpy.unique(values.cat.codes.values)
+        return [str(values.cat.categories[c]) for c in codes if c >= 0]
+    return [str(v) for v in order_versions(values.dropna())]
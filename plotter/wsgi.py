@@ -0,0 +1,5 @@
+# WSGI entry point, preloaded by gunicorn before forking its workers: gunicorn --config gunicorn.conf.py wsgi:server
+import main
+
+app = main.create_app(preload=True, listen=False)
+server = app.server
@@ -142,6 +142,14 @@ func streamToDatabase(metrics top.PodMetricTable) error {
 	}
 	nrows, _ := resp.RowsAffected()
 	klog.Infof("insert success, updated %d rows", nrows)
+
+	// the insert has already succeeded, a stale rollup is caught up by the plotter on its next read
+	if err = dbhandler.RefreshRollup(db); err != nil {
+		klog.Warningf("failed to refresh plotter rollup: %v", err)
+	}
+	if err = dbhandler.Notify(db, version); err != nil {
+		klog.Warningf("failed to notify plotter: %v", err)
+	}
 	return nil
 }
 
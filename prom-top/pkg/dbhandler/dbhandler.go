@@ -84,6 +84,37 @@ const TimestampFormat = `2006-01-02 15:04:05`
 // Table is a hardcoded table name.  Will be replaced with dynamically set names.
 const Table = "caliper_metrics"
 
+// RollupView is the per version/group summary of Table read by the plotter.  It is created by the plotter
+// (see plotter/sql/rollup.sql) and must be refreshed whenever rows are added to Table.
+const RollupView = "caliper_group_rollup"
+
+// NotifyChannel is notified with the version of every run written to Table, so that a running plotter can pick up
+// new results without polling.
+const NotifyChannel = "caliper_metrics"
+
+// Notify tells listeners on NotifyChannel that rows for version were written to Table.
+func Notify(db *sqlx.DB, version string) error {
+	if _, err := db.Exec(`SELECT pg_notify($1, $2)`, NotifyChannel, version); err != nil {
+		return fmt.Errorf("notifying %s: %v", NotifyChannel, err)
+	}
+	return nil
+}
+
+// RefreshRollup recomputes RollupView.  It is a no-op if the plotter has not created the view yet.
+func RefreshRollup(db *sqlx.DB) error {
+	var exists bool
+	if err := db.Get(&exists, `SELECT to_regclass($1) IS NOT NULL`, RollupView); err != nil {
+		return fmt.Errorf("checking for %s: %v", RollupView, err)
+	}
+	if !exists {
+		return nil
+	}
+	if _, err := db.Exec(fmt.Sprintf("REFRESH MATERIALIZED VIEW CONCURRENTLY %s", RollupView)); err != nil {
+		return fmt.Errorf("refreshing %s: %v", RollupView, err)
+	}
+	return nil
+}
+
 const (
 	host     = "PGHOST"
 	port     = "PGPORT"
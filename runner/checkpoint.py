@@ -0,0 +1,61 @@
+import json
+import os
+import time
+from os import path
+
+# a version's steps, in order. A rerun skips the completed ones
+steps = ['fetch', 'configure', 'create', 'settle', 'login', 'collect', 'destroy']
+
+checkpoint_file = 'checkpoint.json'
+
+
+class Checkpoint:
+    """
+    The steps a version's run has completed, persisted in its work dir after each one, and its last failure.
+    """
+
+    def __init__(self, work_dir=''):
+        self.path = path.join(work_dir, checkpoint_file)
+        self.completed = []
+        self.failed = None
+        self.exists = path.exists(self.path)
+        if self.exists:
+            with open(self.path, mode='r') as file:
+                state = json.load(file)
+            self.completed = [step for step in steps if step in state.get('completed', [])]
+            self.failed = state.get('failed')
+
+    def done(self, step=''):
+        return step in self.completed
+
+    def finished(self):
+        # every step, not just destroy, which also tears down the cluster of a failed run
+        return all(self.done(step) for step in steps)
+
+    def complete(self, step=''):
+        if step not in self.completed:
+            self.completed.append(step)
+        if self.failed and self.failed['step'] == step:
+            self.failed = None
+        self.save()
+
+    def fail(self, step=''):
+        self.failed = {'step': step, 'time': time.time()}
+        self.save()
+
+    def redo(self, step=''):
+        # forget just step, e.g. when what it left behind is gone
+        self.completed = [s for s in self.completed if s != step]
+        self.save()
+
+    def reset(self, step=''):
+        # forget step and every step after it
+        self.completed = [s for s in self.completed if steps.index(s) < steps.index(step)]
+        self.save()
+
+    def save(self):
+        tmp = f'{self.path}.tmp'
+        with open(tmp, mode='w') as file:
+            json.dump({'completed': self.completed, 'failed': self.failed, 'updated': time.time()}, file, indent=2)
+        os.replace(tmp, self.path)
+        self.exists = True
@@ -0,0 +1,150 @@
+"""
+Content-addressed cache of the binaries in mirror tarballs, shared by every version and run.
+
+A binary is stored as <cache>/<sha256 of its tarball>/<name>, the tarball's sha256 coming from the mirror's
+sha256sum.txt, so it's only ever downloaded once, and versions (or 'latest') sharing a tarball share its binaries.
+Tarballs are never written to disk: the binary is extracted while the tarball streams in, and only moved into the
+cache once the whole stream has matched its checksum.  Dropped connections are resumed with HTTP range requests.
+"""
+import hashlib
+import os
+import shutil
+import tarfile
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPException
+from urllib.request import Request, urlopen
+
+chunk_size = 1 << 20
+
+
+class ChecksumError(Exception):
+    pass
+
+
+def checksums(url='', timeout=60) -> dict:
+    # {file name: sha256} listed in a sha256sum.txt
+    with urlopen(url, timeout=timeout) as response:
+        text = response.read().decode()
+    sums = {}
+    for line in text.splitlines():
+        parts = line.split()
+        if len(parts) == 2:
+            sums[parts[1].lstrip('*')] = parts[0].lower()
+    return sums
+
+
+class ResumingStream:
+    """
+    Read-only file over a download, which reconnects with a Range request for the rest when the connection drops or
+    ends early, and hashes everything read.
+    """
+
+    def __init__(self, url='', retries=5, timeout=60):
+        self.url = url
+        self.retries = retries
+        self.timeout = timeout
+        self.offset = 0
+        self.length = None
+        self.sha256 = hashlib.sha256()
+        self._response = self._open()
+        length = self._response.headers.get('Content-Length')
+        self.length = int(length) if length is not None else None
+
+    def _open(self):
+        request = Request(self.url)
+        if self.offset:
+            request.add_header('Range', f'bytes={self.offset}-')
+        response = urlopen(request, timeout=self.timeout)
+        if self.offset and getattr(response, 'status', None) != 206:
+            # the server ignored the range, skip what was already read
+            skip = self.offset
+            while skip > 0:
+                data = response.read(min(skip, chunk_size))
+                if not data:
+                    raise ConnectionError(f'{self.url} is shorter than before')
+                skip -= len(data)
+        return response
+
+    def read(self, size=-1):
+        failures = 0
+        while True:
+            try:
+                data = self._response.read(size)
+                if data or size == 0 or self.length is None or self.offset >= self.length:
+                    break
+                error = ConnectionError(f'{self.url} ended after {self.offset} of {self.length} bytes')
+            except (OSError, HTTPException) as e:
+                error = e
+            failures += 1
+            if failures > self.retries:
+                raise error
+            print(f'download of {self.url} interrupted at byte {self.offset}, resuming: {error}')
+            self._response.close()
+            time.sleep(min(2 ** failures, 30))
+            self._response = self._open()
+        self.offset += len(data)
+        self.sha256.update(data)
+        return data
+
+    def close(self):
+        self._response.close()
+
+
+def fetch(url='', name='', cache_dir='', sha256=''):
+    """
+    Path of the cached binary name from the tarball at url, whose sha256 is given; downloaded on a cache miss.
+    """
+    target_dir = os.path.join(cache_dir, sha256)
+    target = os.path.join(target_dir, name)
+    if os.path.exists(target):
+        print(f'{name}: using cached {target}')
+        return target
+
+    print(f'{name}: downloading {url}')
+    # connect before creating anything in the cache, so a failed connection leaves nothing behind
+    stream = ResumingStream(url)
+    tmp = None
+    try:
+        os.makedirs(target_dir, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=target_dir, prefix=f'.{name}.')
+        found = False
+        with os.fdopen(fd, 'wb') as out, tarfile.open(fileobj=stream, mode='r|gz') as tar:
+            for member in tar:
+                if member.isfile() and os.path.basename(member.name) == name:
+                    shutil.copyfileobj(tar.extractfile(member), out, chunk_size)
+                    os.chmod(tmp, member.mode | 0o500)
+                    found = True
+            # the checksum covers the whole tarball, not just the members read
+            while stream.read(chunk_size):
+                pass
+        if not found:
+            raise FileNotFoundError(f'{url} has no {name}')
+        if stream.sha256.hexdigest() != sha256:
+            raise ChecksumError(f'{url}: sha256 {stream.sha256.hexdigest()} does not match sha256sum.txt {sha256}')
+        os.replace(tmp, target)
+    finally:
+        stream.close()
+        if tmp is not None and os.path.exists(tmp):
+            os.remove(tmp)
+    print(f'{name}: verified and cached at {target}')
+    return target
+
+
+def fetch_all(urls={}, cache_dir='') -> dict:
+    # {name: url of a tarball containing it} -> {name: cached path}, downloading concurrently
+    sums = {}
+    for mirror_dir in {os.path.dirname(url) for url in urls.values()}:
+        sums[mirror_dir] = checksums(f'{mirror_dir}/sha256sum.txt')
+
+    def get(name):
+        url = urls[name]
+        tarball = os.path.basename(url)
+        sha256 = sums[os.path.dirname(url)].get(tarball)
+        if sha256 is None:
+            raise ChecksumError(f'{tarball} is not listed in {os.path.dirname(url)}/sha256sum.txt')
+        return fetch(url, name, cache_dir, sha256)
+
+    with ThreadPoolExecutor(max_workers=len(urls) or 1) as pool:
+        return dict(zip(urls, pool.map(get, urls)))
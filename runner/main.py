@@ -1,43 +1,73 @@
 import argparse
+import json
 import os
 import shutil
-import tarfile
+import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
 from os import path
-from subprocess import run
-from urllib.error import ContentTooShortError
-from urllib.request import urlretrieve
+from subprocess import STDOUT, run
 
-import progressbar
 import semver
 import yaml
 
+import checkpoint
+import downloads
+import readiness
 import settings as s
+import telemetry
+
+# a version's phases, each run in its own runner process by run_versions(), and the checkpointed steps of each
+phases = ['prepare', 'deploy', 'destroy']
+phase_steps = {'prepare': ['fetch', 'configure'], 'deploy': ['create', 'settle', 'login', 'collect'],
+               'destroy': ['destroy']}
 
 
 def set_args():
     parser = argparse.ArgumentParser()
     parser.add_argument('-v', '--version', type=str, dest='version', default='latest', help='cluster version to deploy')
+    parser.add_argument('--versions', type=str, dest='versions',
+                        help='comma separated versions or ranges (e.g. 4.6.1..4.6.9) to deploy concurrently')
+    parser.add_argument('-p', '--parallel', type=int, dest='parallel',
+                        help='max clusters deployed at once with --versions (default: CALIPER_MAX_PARALLEL, or 2)')
+    parser.add_argument('--phase', type=str, dest='phase', default='all', choices=['all'] + phases,
+                        help='only run this phase of the version (used by --versions)')
+    parser.add_argument('--fresh', action='store_true', dest='fresh',
+                        help='ignore the checkpoint of an earlier run instead of resuming it')
+    parser.add_argument('--keep-failed', action='store_true', dest='keep_failed',
+                        help='keep a cluster whose run failed after it was created, for a rerun to resume')
+    parser.add_argument('--run-id', type=str, dest='run_id', default='',
+                        help='id the step timings are recorded under (default: a new one; set by --versions)')
     parser.add_argument('-d', '--dir', type=str, dest='work_dir', default=s.CLUSTER_WORKDIR,
                         help='optional prefix path for cluster dir')
     parser.add_argument('--region', type=str, dest='region', default='us-east-2', help='AWS region')
     parser.add_argument('--install-config', type=str, dest='install_config',
                         help='path to a fully defined ignition config', required=True)
+    parser.add_argument('--prom-top', type=str, dest='prom_top', choices=list(s.prom_top_sources),
+                        help='run prom-top from its docker image or a PATH binary (default: whichever is found)')
+    parser.add_argument('--env-file', type=str, dest='env_file', help='.env file (default: the nearest one found)')
     return parser.parse_args()
 
 
+def apply_overrides(args=argparse.Namespace()):
+    # before any setting is read, which would load the default .env
+    if args.prom_top:
+        s.settings.override(PROM_TOP_SOURCE=s.prom_top_sources[args.prom_top])
+    if args.env_file:
+        args.env_file = path.realpath(args.env_file)
+        os.environ['CALIPER_DOTENV'] = args.env_file
+
+
 def parse_args_install_config(args=argparse.Namespace()):
     return args.install_config
 
 
 def prom_top_command(kubeconfig='', version=''):
-    cmd = []
+    cmd = ['prom-top']
     args = [f'--postgres', '--ocp-version', f'{str(version)}', '--range', f'{str(s.TEST_RANGE_SECONDS)}s']
-    if s.PROM_TOP_SOURCE == 1:
+    if s.PROM_TOP_SOURCE == s.PROM_TOP_DOCKER:
         cmd = [f'docker', 'run', '--network', 'build_postgres', '--rm', '-v', f'{kubeconfig}:/root/.kube/config',
-               '--env-file', f'{s.DOTENV}', '-e', 'PGHOST=postgres', 'quay.io/jcope/prom-top:latest']
-    elif s.PROM_TOP_SOURCE == 2:
-        cmd = ['prom-top']
+               '--env-file', f'{s.DOTENV}', '-e', 'PGHOST=postgres', s.prom_top_image]
     return cmd + args
 
 
@@ -49,10 +79,25 @@ def parse_args_version(args=argparse.Namespace()):
         if v != 'latest':
             semver.VersionInfo.parse(v)
     except ValueError as e:
-        ValueError(f'Expected semver format or "latest", got {v}: {e}')
+        raise ValueError(f'Expected semver format or "latest", got {v}: {e}')
     return v
 
 
+def parse_args_versions(args=argparse.Namespace()):
+    # '4.6.1,4.6.3..4.6.5,latest' -> ['4.6.1', '4.6.3', '4.6.4', '4.6.5', 'latest']. Ranges step the patch version.
+    versions = []
+    for v in args.versions.split(','):
+        v = v.strip()
+        if '..' in v:
+            first, last = (semver.VersionInfo.parse(b) for b in v.split('..'))
+            if (first.major, first.minor) != (last.major, last.minor) or first.patch > last.patch:
+                raise ValueError(f'version range {v} must step up the patch version of one major.minor')
+            versions += [f'{first.major}.{first.minor}.{p}' for p in range(first.patch, last.patch + 1)]
+        elif v:
+            versions.append(parse_args_version(argparse.Namespace(version=v)))
+    return list(dict.fromkeys(versions))
+
+
 def parse_args_region(args=argparse.Namespace()):
     return args.region
 
@@ -75,16 +120,13 @@ def versioned_bin(ocp_binary, version):
 
 
 def source(ocp_binary, version):
-    return f'https://mirror.openshift.com/pub/openshift-v4/clients/ocp/{version}/{versioned_bin(ocp_binary, version)}'
+    return f'{s.OCP_MIRROR}/{version}/{versioned_bin(ocp_binary, version)}'
 
 
-def mk_work_dir(version):
-    d = path.join(s.CLUSTER_WORKDIR, version)
-    try:
-        os.mkdir(d)
-    except FileExistsError:
-        # we'll be overwriting the tars and bins here anyway.
-        pass
+def mk_work_dir(version, parent=s.CLUSTER_WORKDIR):
+    d = path.join(parent, version)
+    # we'll be overwriting the tars and bins here anyway.
+    os.makedirs(d, exist_ok=True)
     return d
 
 
@@ -115,56 +157,17 @@ def mk_deploy_dir(parent):
     return d
 
 
-pbar = None
-
-
-def show_progress(block_num, block_size, total_size):
-    global pbar
-    if pbar is None:
-        pbar = progressbar.ProgressBar(maxval=total_size, term_width=120,
-                                       widgets=[progressbar.widgets.ETA(), progressbar.widgets.Bar()]).start()
-
-    downloaded = block_num * block_size
-    if downloaded < total_size:
-        pbar.update(downloaded)
-    else:
-        pbar.finish()
-        pbar = None
-
-
-def fetch_binary(src, dst, name):
-    tarball = os.path.join(dst, os.path.basename(src))
-    target = os.path.join(dst, f'{name}')
-    try:
-        os.stat(target)  # short circuit to avoid redownloading tarballs
-    except FileNotFoundError:
-        pass
-    else:
-        return target
-
-    try:
-        urlretrieve(url=src, filename=tarball, reporthook=show_progress)
-    except ContentTooShortError as e:
-        raise ContentTooShortError(f"failed to download {src}: {e}")
-
-    with tarfile.open(tarball) as tar:
-        tar.extract(member=name, path=dst)
-        tar.close()
-    return target
-
-
-def fetch_oc_bin(src, dst):
-    try:
-        return fetch_binary(src, dst, 'oc')
-    except Exception as e:
-        raise Exception(f"failed to download openshift-client: {e}")
-
-
-def fetch_openshift_install_bin(src, dst):
-    try:
-        return fetch_binary(src, dst, 'openshift-install')
-    except Exception as e:
-        raise Exception(f"failed to download openshift-install: {e}")
+def fetch_binaries(links, dst):
+    # {name: tarball link} -> {name: path}, from the shared download cache. The work dir links to each binary, e.g. to
+    # destroy a cluster by hand
+    binaries = {}
+    for name, cached in downloads.fetch_all(links, s.DOWNLOAD_CACHE).items():
+        link = os.path.join(dst, name)
+        if os.path.lexists(link):
+            os.remove(link)
+        os.symlink(os.path.realpath(cached), link)
+        binaries[name] = link
+    return binaries
 
 
 def prepare_install_config(src, dst, version, region):
@@ -202,87 +205,309 @@ def get_cluster_passwd(deploy_dir):
     return password
 
 
-oc = ''
-
-
-def main():
-    args = set_args()
-    version = parse_args_version(args)
-    region = parse_args_region(args)
-    install_config = parse_install_config(args)
-    installer_link = source('openshift-install', version)
-    client_link = source('openshift-client', version)
+def run_phase(args, version, phase):
+    # runs one phase of a version in a child runner, appending to the version's log; returns its status
+    work_dir = mk_work_dir(version, args.work_dir)
+    log_file = path.join(work_dir, 'runner.log')
+    cmd = [sys.executable, '-u', path.realpath(__file__), '--version', version, '--dir', args.work_dir,
+           '--region', args.region, '--install-config', args.install_config, '--phase', phase, '--run-id', args.run_id]
+    if args.prom_top:
+        cmd += ['--prom-top', args.prom_top]
+    if args.env_file:
+        cmd += ['--env-file', args.env_file]
+    start = time.time()
+    with open(log_file, mode='a') as log:
+        output = run(cmd, check=False, text=True, stdout=log, stderr=STDOUT)
+    status = {'returncode': output.returncode, 'seconds': round(time.time() - start)}
+    print(f'{version}: {phase} {"succeeded" if output.returncode == 0 else "failed"} after {status["seconds"]}s')
+    return status
+
+
+def run_versions(args, versions):
+    """
+    Pipelines the phases of every version: all versions are prepared up front, at most args.parallel clusters are
+    deployed at once, and each cluster is destroyed in the background so the next deploy can start right away.
+    """
+    args.run_id = args.run_id or telemetry.new_run_id()
+    print(f'run {args.run_id}: deploying {len(versions)} versions, {args.parallel} at a time: {", ".join(versions)}')
+    start = time.time()
+    statuses = {v: {'log': path.join(mk_work_dir(v, args.work_dir), 'runner.log')} for v in versions}
+    for v in versions:
+        progress = checkpoint.Checkpoint(path.join(args.work_dir, v))
+        if args.fresh:
+            progress.reset(checkpoint.steps[0])
+        elif progress.finished():
+            print(f'{v}: already run to completion, skipping (pass --fresh to run it again)')
+            statuses[v]['skipped'] = True
+        elif progress.completed:
+            print(f'{v}: resuming after its {progress.completed[-1]} step')
+    versions = [v for v in versions if not statuses[v].get('skipped')]
+    parallel = max(1, args.parallel)
+    teardowns = {}
+
+    def pipeline(version, prepared):
+        statuses[version]['prepare'] = prepared.result()
+        if statuses[version]['prepare']['returncode'] != 0:
+            return
+        statuses[version]['deploy'] = run_phase(args, version, 'deploy')
+        if statuses[version]['deploy']['returncode'] != 0 and args.keep_failed \
+                and checkpoint.Checkpoint(path.join(args.work_dir, version)).done('create'):
+            print(f'{version}: keeping its cluster for a rerun to resume')
+        elif live_cluster(path.join(args.work_dir, version, 'deploy')):
+            teardowns[version] = destroy_pool.submit(run_phase, args, version, 'destroy')
+
+    with ThreadPoolExecutor(max_workers=parallel) as prepare_pool, \
+            ThreadPoolExecutor(max_workers=len(versions) or 1) as destroy_pool, \
+            ThreadPoolExecutor(max_workers=parallel) as deploy_pool:
+        prepared = {v: prepare_pool.submit(run_phase, args, v, 'prepare') for v in versions}
+        for job in [deploy_pool.submit(pipeline, v, prepared[v]) for v in versions]:
+            job.result()
+        pending = [v for v, job in teardowns.items() if not job.done()]
+        if pending:
+            print(f'waiting for {len(pending)} cluster teardowns: {", ".join(pending)}')
+        for v, job in teardowns.items():
+            statuses[v]['destroy'] = job.result()
+    for v in versions:
+        progress = checkpoint.Checkpoint(path.join(args.work_dir, v))
+        statuses[v]['checkpoint'] = {'completed': progress.completed, 'failed': progress.failed}
+        statuses[v]['steps'] = telemetry.RunRecord(path.join(args.work_dir, v), v, args.run_id).path
+
+    hours = (time.time() - start) / 3600
+    summary = path.join(args.work_dir, 'runs.json')
+    with open(summary, mode='w') as file:
+        json.dump({'run_id': args.run_id, 'versions': statuses}, file, indent=2)
+    failed = [v for v, st in statuses.items() if any(st.get(p, {}).get('returncode', 0) != 0 for p in phases)]
+    deployed = [v for v, st in statuses.items() if st.get('deploy', {}).get('returncode') == 0]
+    print(f'{len(versions) - len(failed)} of {len(versions)} versions succeeded in {hours * 60:.1f}min '
+          f'({len(deployed) / hours if hours else 0:.1f} versions/hour), see {summary}')
+    if failed:
+        print(f'failed: {", ".join(failed)}')
+    return 1 if failed else 0
+
+
+def destroy_cluster(openshift_install, deploy_dir, result=None):
+    output = run([openshift_install, 'destroy', 'cluster', '--dir', deploy_dir], check=False, text=True)
+    if result is not None:
+        result['returncode'] = output.returncode
+    if output.returncode > 0:
+        print(f'cluster teardown failed: {output.stderr}')
+        return False
+    return True
 
-    work_dir = mk_work_dir(version)
 
+def fetch(cluster, result):
+    installer_link = source('openshift-install', cluster.version)
+    client_link = source('openshift-client', cluster.version)
     print(
         'Deployment Params:\n'
-        f'\tVersion: {version}\n'
+        f'\tVersion: {cluster.version}\n'
         f'\tClient: {client_link}\n'
         f'\tInstaller: {installer_link}\n'
-        f'\tWorking Dir: {work_dir}\n'
+        f'\tWorking Dir: {cluster.work_dir}\n'
     )
-    time.sleep(3)
-
     try:
-        deploy_dir = mk_deploy_dir(work_dir)
-    except FileExistsError as e:
-        raise e
-    prepare_install_config(src=install_config, dst=deploy_dir, version=version, region=region)
-
-    global oc
-    try:
-        oc = fetch_oc_bin(client_link, work_dir)
-        openshift_install = fetch_openshift_install_bin(installer_link, work_dir)
+        fetch_binaries({'oc': client_link, 'openshift-install': installer_link}, cluster.work_dir)
     except Exception as e:
-        print(e)
-        quit(1)
+        print(f'failed to download openshift binaries: {e}')
+        return False
+    return True
+
+
+def configure(cluster, result):
+    mk_deploy_dir(cluster.work_dir)
+    prepare_install_config(src=cluster.install_config, dst=cluster.deploy_dir, version=cluster.version,
+                           region=cluster.region)
+    return True
 
+
+def create(cluster, result):
     print('starting cluster creation')
-    output = run([openshift_install, 'create', 'cluster', '--dir', f'{deploy_dir}'], check=False, text=True)
+    output = run([cluster.openshift_install, 'create', 'cluster', '--dir', f'{cluster.deploy_dir}'],
+                 check=False, text=True)
+    result['returncode'] = output.returncode
     if output.returncode > 0:
         print(f'error creating cluster:\ncmd: {output.args}\nerr:{output.stderr}')
-        quit(1)
+        return False
+    return True
 
-    print(f'Waiting {s.CLUSTER_INIT_BUFFER_SECONDS / 60}min to allow cluster to settle')
-    time.sleep(s.CLUSTER_INIT_BUFFER_SECONDS)
-    print(f'Waiting {s.TEST_RANGE_SECONDS / 60}min to generate a stable data set')
+
+def settle(cluster, result):
+    print(f'Waiting up to {s.CLUSTER_READY_TIMEOUT_SECONDS / 60:.1f}min for cluster operators to settle '
+          f'for {s.CLUSTER_STABLE_SECONDS / 60:.1f}min')
+    try:
+        settled = readiness.wait_until_stable(lambda: readiness.get_operators(cluster.oc, cluster.kubeconfig),
+                                              s.CLUSTER_STABLE_SECONDS, s.CLUSTER_READY_TIMEOUT_SECONDS,
+                                              s.CLUSTER_POLL_SECONDS)
+    except TimeoutError as e:
+        print(f'cluster never settled: {e}')
+        return False
+    result['detail'] = {'ready_seconds': round(settled, 3), 'test_range_seconds': s.TEST_RANGE_SECONDS}
+    print(f'Cluster stable after {settled / 60:.1f}min, '
+          f'waiting {s.TEST_RANGE_SECONDS / 60:.1f}min to generate a stable data set')
+    time.sleep(s.TEST_RANGE_SECONDS)
     print('Wait expired, gathering data')
+    return True
+
 
+def login(cluster, result):
     password = ''
     try:
-        password = get_cluster_passwd(deploy_dir)
+        password = get_cluster_passwd(cluster.deploy_dir)
     except FileNotFoundError as e:
         print(f"failed to get cluster password: {e}")
-        quit(1)
-
-    kubeconfig = path.join(deploy_dir, 'auth/kubeconfig')
-    os.putenv('KUBECONFIG', kubeconfig)
+        return False
 
     login_retries = 10
     for i in range(0, login_retries):
-        output = run([oc, '--kubeconfig', kubeconfig, 'login', '-u', 'kubeadmin', '-p', password], check=False, text=True)
+        output = run([cluster.oc, '--kubeconfig', cluster.kubeconfig, 'login', '-u', 'kubeadmin', '-p', password],
+                     check=False, text=True)
+        result['returncode'] = output.returncode
+        result['retries'] = i
         if output.returncode == 0:
             break
         elif output.returncode > 0 and i == login_retries - 1:
             print(f"failed to login to cluster after {login_retries}")
-            quit(1)
+            return False
         print('failed to login to cluster, retrying')
+    return True
 
-    prom_top = prom_top_command(kubeconfig, version)
-    if len(prom_top) == 0:
-        print('prom-top image or binary not found')
-        quit(1)
+
+def collect(cluster, result):
+    os.putenv('KUBECONFIG', cluster.kubeconfig)
+    prom_top = prom_top_command(cluster.kubeconfig, cluster.version)
     output = run(prom_top, text=True, check=False)
+    result['returncode'] = output.returncode
     if output.returncode > 0:
         print('prom-top failed')
+        return False
+    return True
+
+
+def destroy(cluster, result):
+    return destroy_cluster(cluster.openshift_install, cluster.deploy_dir, result)
+
+
+step_functions = {'fetch': fetch, 'configure': configure, 'create': create, 'settle': settle, 'login': login,
+                  'collect': collect, 'destroy': destroy}
+
+
+def run_steps(cluster, progress, names, record):
+    """
+    Runs the named steps in order, skipping those already completed, checkpointing each one that succeeds and
+    recording the timing of each one run.  Steps report their exit code, retries and any detail in their result.
+    """
+    for step in names:
+        if progress.done(step):
+            print(f'{step}: completed by an earlier run, skipping')
+            continue
+        print(f'{step}: starting')
+        result = {}
+        started = time.time()
+        try:
+            ok = step_functions[step](cluster, result)
+        except Exception as e:
+            # recorded as a failed step, so the cluster it may have left up is still torn down or kept for a rerun
+            print(f'{step}: got exception type {type(e)}:\n{e}')
+            ok = False
+        entry = record.add(step, started, time.time(), ok, **result)
+        print(f'{step}: {"done" if ok else "failed"} after {entry["seconds"]:.0f}s')
+        if not ok:
+            progress.fail(step)
+            return False
+        progress.complete(step)
+    return True
+
+
+def resume(cluster, progress, record):
+    """
+    Reconciles the checkpoint of an earlier run with what it left behind, so run_steps() can pick up after it: a live
+    cluster is reused, a half installed one is destroyed and one that's gone is created again.
+    """
+    if progress.done('fetch') and not all(path.exists(b) for b in (cluster.oc, cluster.openshift_install)):
+        progress.redo('fetch')
+    live = live_cluster(cluster.deploy_dir)
+    if progress.done('create') and not live:
+        print('the cluster created by an earlier run is gone, creating another')
+        progress.reset('configure')
+    elif progress.done('configure') and not progress.done('create') and live:
+        # configure refuses a deploy dir with a cluster in it, so this one is ours. openshift-install can't reliably
+        # pick up an install it didn't finish
+        print('an earlier run was interrupted while creating the cluster, destroying it to start over')
+        if not run_steps(cluster, progress, ['fetch'], record) or not destroy(cluster, {}):
+            return False
+        progress.reset('configure')
+    elif progress.done('create'):
+        print(f'reusing the cluster created by an earlier run, resuming after its {progress.completed[-1]} step')
+    if progress.done('configure') and not progress.done('create') and \
+            not path.exists(path.join(cluster.deploy_dir, path.basename(cluster.install_config))):
+        # openshift-install consumes the install config, even when it fails
+        progress.redo('configure')
+    return True
+
+
+def cluster_paths(version, work_dir, install_config='', region=''):
+    deploy_dir = path.join(work_dir, 'deploy')
+    return argparse.Namespace(version=version, work_dir=work_dir, deploy_dir=deploy_dir,
+                              install_config=install_config, region=region,
+                              oc=path.join(work_dir, 'oc'), openshift_install=path.join(work_dir, 'openshift-install'),
+                              kubeconfig=path.join(deploy_dir, 'auth/kubeconfig'))
+
+
+oc = ''
+
+
+def main():
+    args = set_args()
+    apply_overrides(args)
+    if args.versions:
+        try:
+            versions = parse_args_versions(args)
+        except ValueError as e:
+            print(e)
+            quit(1)
+        args.install_config = parse_install_config(args)
+        args.work_dir = path.realpath(args.work_dir)
+        args.parallel = args.parallel or s.MAX_PARALLEL
+        quit(run_versions(args, versions))
+
+    try:
+        version = parse_args_version(args)
+    except ValueError as e:
+        print(e)
+        quit(1)
+    work_dir = mk_work_dir(version, args.work_dir)
+    cluster = cluster_paths(version, work_dir, parse_install_config(args), parse_args_region(args))
+    progress = checkpoint.Checkpoint(work_dir)
+    if args.fresh:
+        progress.reset(checkpoint.steps[0])
+    if args.phase == 'all' and progress.finished():
+        print(f'{version} was already run to completion, pass --fresh to run it again')
+        quit(0)
+    record = telemetry.RunRecord(work_dir, version, args.run_id or telemetry.new_run_id(), s.TELEMETRY_POSTGRES)
+    if not resume(cluster, progress, record):
         quit(1)
 
-    output = run([openshift_install, 'destroy', 'cluster', '--dir', deploy_dir], check=False, text=True)
-    if output.returncode > 0:
-        print(f'cluster teardown failed: {output.stderr}')
+    global oc
+    oc = cluster.oc
+    names = checkpoint.steps if args.phase == 'all' else phase_steps[args.phase]
+    ok = run_steps(cluster, progress, [step for step in names if step != 'destroy'], record)
+    if args.phase == 'destroy' and not live_cluster(cluster.deploy_dir):
+        # e.g. resume() already destroyed a cluster whose install was interrupted
+        print('no cluster left to destroy')
+    elif args.phase == 'destroy' or (args.phase == 'all' and live_cluster(cluster.deploy_dir)):
+        if args.phase == 'all' and not progress.done('create') and (progress.failed or {}).get('step') != 'create':
+            # e.g. a cluster left by a runner without a checkpoint, which configure refused to overwrite
+            print(f'not destroying {cluster.deploy_dir}, which this run did not create')
+        elif args.phase == 'all' and not ok and args.keep_failed and progress.done('create'):
+            print(f'keeping the cluster for a rerun to resume, or destroy it with: '
+                  f'{cluster.openshift_install} destroy cluster --dir {cluster.deploy_dir}')
+        elif not run_steps(cluster, progress, ['destroy'], record):
+            quit(1)
+        else:
+            print('cluster destroyed')
+    if not ok:
         quit(1)
-    print('cluster destroyed, job complete')
+    print(f'{args.phase} complete')
 
     quit(0)
 
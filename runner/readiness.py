@@ -0,0 +1,62 @@
+import json
+import time
+from subprocess import run
+
+
+def unsettled(operators={}) -> list:
+    # names of the ClusterOperators (as in oc get clusteroperators -o json) not Available, or Progressing or Degraded
+    names = []
+    for item in operators.get('items', []):
+        conditions = {c.get('type'): c.get('status') for c in item.get('status', {}).get('conditions', [])}
+        if conditions.get('Available') != 'True' or conditions.get('Progressing') != 'False' \
+                or conditions.get('Degraded') == 'True':
+            names.append(item.get('metadata', {}).get('name', '?'))
+    return names
+
+
+def get_operators(oc='', kubeconfig=''):
+    # the cluster's ClusterOperators, or None if the API can't be reached yet
+    output = run([oc, '--kubeconfig', kubeconfig, 'get', 'clusteroperators', '-o', 'json'],
+                 check=False, text=True, capture_output=True)
+    if output.returncode > 0:
+        return None
+    try:
+        return json.loads(output.stdout)
+    except ValueError:
+        return None
+
+
+def wait_until_stable(poll, window=300, timeout=3600, interval=30, clock=time.monotonic, sleep=time.sleep, log=print):
+    """
+    Call poll() every interval seconds until every operator it returns has stayed settled for window seconds, and
+    return the seconds that took.  Raises TimeoutError once timeout seconds pass without it.
+
+    poll() returns what get_operators() does; clock, sleep and log are only replaced to test this without a cluster.
+    """
+    start = clock()
+    stable_since = None
+    last = None
+    while True:
+        now = clock()
+        operators = poll()
+        if operators is None:
+            pending = ['(cluster API unreachable)']
+        elif not operators.get('items'):
+            pending = ['(no cluster operators yet)']
+        else:
+            pending = unsettled(operators)
+
+        if pending:
+            stable_since = None
+        elif stable_since is None:
+            stable_since = now
+        if stable_since is not None and now - stable_since >= window:
+            return now - start
+        if now - start >= timeout:
+            raise TimeoutError(f'not stable after {timeout / 60:.1f}min, unsettled: {", ".join(pending) or "none"}')
+
+        if pending != last:
+            log(f'waiting on cluster operators: {", ".join(pending)}' if pending else
+                f'cluster operators settled, waiting {window / 60:.1f}min for them to stay that way')
+            last = pending
+        sleep(max(0, min(interval, start + timeout - now)))
@@ -1,45 +1,157 @@
-import dotenv
-from dotenv import load_dotenv
-from subprocess import run, DEVNULL
-from os import path
+"""
+The runner's settings, each resolved on first use rather than on import, so importing this (or main.py) runs nothing.
+
+Read them as module attributes, e.g. settings.HOST_PLATFORM.  The .env file is loaded before the first setting read
+from the environment, the host platform and prom-top source are probed when first needed, and probes are cached for
+CALIPER_PROBE_TTL_SECONDS.  Anything that can't be resolved raises SettingsError.
+"""
+import os
 import platform
+import shutil
+import threading
+import time
+from os import path
+from subprocess import DEVNULL, run
+
+import dotenv
 
-def get_platform():
-    host_os = ''
-    if platform.system() == 'Darwin':
-        host_os = 'mac'
-    elif platform.system().lower() == 'Linux':
-        host_os = 'linux'
-    else:
-        print('unsupported OS (sorry Windows)')
-        quit(0)
-    return host_os
-
-
-# Return 0 if none found, 1 if docker image, 2 if local PATH binary
-def verify_prom_top():
-    output = run(['docker', 'inspect', 'quay.io/jcope/prom-top:latest'], check=False, text=True, stdout=DEVNULL)
-    if output.returncode > 0:
-        output = run(['which', 'prom-top'], check=False, text=True, stdout=DEVNULL)
-        if output.returncode > 0:
-            return 0
-        else:
-            return 2
-    return 1
-
-
-_env_file = dotenv.find_dotenv()
-if _env_file == '':
-    print('cannot find .env file')
-    quit(1)
-
-CLUSTER_INIT_BUFFER_SECONDS = 20 * 60
-TEST_RANGE_SECONDS = 10 * 60  # time to allow the cluster to stabilize before gather metrics
-MAX_WAIT_SECONDS = CLUSTER_INIT_BUFFER_SECONDS + TEST_RANGE_SECONDS
 REPO_ROOT = path.realpath(path.join(path.dirname(__file__), path.pardir))
 CLUSTER_WORKDIR = path.join(REPO_ROOT, '_clusters')
-HOST_PLATFORM = get_platform()
-PROM_TOP_SOURCE = verify_prom_top()
-DOTENV = path.realpath(_env_file)
 
-load_dotenv(DOTENV)
+# PROM_TOP_SOURCE values, and the names CALIPER_PROM_TOP and --prom-top accept for them
+PROM_TOP_DOCKER = 1
+PROM_TOP_BINARY = 2
+prom_top_sources = {'docker': PROM_TOP_DOCKER, 'binary': PROM_TOP_BINARY}
+
+prom_top_image = 'quay.io/jcope/prom-top:latest'
+
+
+class SettingsError(Exception):
+    pass
+
+
+def get_platform():
+    system = os.getenv('CALIPER_HOST_PLATFORM') or platform.system().lower()
+    if system in ('darwin', 'mac'):
+        return 'mac'
+    elif system == 'linux':
+        return 'linux'
+    raise SettingsError(f'unsupported OS {system} (sorry Windows)')
+
+
+def verify_prom_top():
+    # where prom-top runs from: its docker image if pulled, else a prom-top binary on the PATH
+    name = os.getenv('CALIPER_PROM_TOP', '')
+    if name:
+        if name not in prom_top_sources:
+            raise SettingsError(f'CALIPER_PROM_TOP must be one of {", ".join(prom_top_sources)}, got {name}')
+        return prom_top_sources[name]
+    try:
+        output = run(['docker', 'inspect', prom_top_image], check=False, stdout=DEVNULL, stderr=DEVNULL)
+        if output.returncode == 0:
+            return PROM_TOP_DOCKER
+    except OSError:
+        # no docker at all
+        pass
+    if shutil.which('prom-top'):
+        return PROM_TOP_BINARY
+    raise SettingsError(f'no prom-top image ({prom_top_image}) or binary found')
+
+
+def find_dotenv():
+    env_file = os.getenv('CALIPER_DOTENV') or dotenv.find_dotenv()
+    if env_file == '' or not path.exists(env_file):
+        raise SettingsError(f'cannot find .env file {env_file}'.rstrip())
+    return path.realpath(env_file)
+
+
+class Settings:
+    """
+    Lazily resolved settings: each name's resolver runs on first read, and again once its ttl has passed (None never
+    expires).  override() pins values, e.g. from the command line, ahead of the environment and any probe.
+    """
+
+    def __init__(self, resolvers={}):
+        self._resolvers = resolvers
+        self._cache = {}
+        self._overrides = {}
+        self._env_loaded = False
+        self._lock = threading.RLock()
+
+    def load_env(self):
+        # the .env file, if there is one, fills in the environment without replacing what's already set
+        with self._lock:
+            if not self._env_loaded:
+                self._env_loaded = True
+                env_file = os.getenv('CALIPER_DOTENV') or dotenv.find_dotenv()
+                if env_file:
+                    dotenv.load_dotenv(env_file)
+
+    def get(self, name=''):
+        if name in self._overrides:
+            return self._overrides[name]
+        if name not in self._resolvers:
+            raise AttributeError(f'no setting {name}')
+        resolve, ttl = self._resolvers[name]
+        with self._lock:
+            now = time.monotonic()
+            cached = self._cache.get(name)
+            if cached is not None and (cached[0] is None or now < cached[0]):
+                return cached[1]
+            self.load_env()
+            value = resolve()
+            self._cache[name] = (None if ttl is None else now + ttl(), value)
+            return value
+
+    def override(self, **values):
+        self._overrides.update(values)
+
+    def invalidate(self):
+        # forget every resolved value, e.g. after pulling the prom-top image
+        with self._lock:
+            self._cache.clear()
+
+
+def _probe_ttl():
+    return float(os.getenv('CALIPER_PROBE_TTL_SECONDS', '300'))
+
+
+def _env(name='', default=None, cast=str):
+    def resolve():
+        value = os.getenv(name, default)
+        try:
+            return cast(value)
+        except ValueError as e:
+            raise SettingsError(f'{name}={value} is not a valid {cast.__name__}: {e}')
+
+    return resolve
+
+
+settings = Settings({
+    # a new cluster is ready once every ClusterOperator has been Available, and neither Progressing nor Degraded,
+    # for CLUSTER_STABLE_SECONDS. Polled every CLUSTER_POLL_SECONDS, giving up after CLUSTER_READY_TIMEOUT_SECONDS
+    'CLUSTER_STABLE_SECONDS': (_env('CALIPER_CLUSTER_STABLE_SECONDS', 5 * 60, int), None),
+    'CLUSTER_READY_TIMEOUT_SECONDS': (_env('CALIPER_CLUSTER_READY_TIMEOUT_SECONDS', 45 * 60, int), None),
+    'CLUSTER_POLL_SECONDS': (_env('CALIPER_CLUSTER_POLL_SECONDS', 30, int), None),
+    # metrics are gathered over this range, starting once the cluster is ready
+    'TEST_RANGE_SECONDS': (_env('CALIPER_TEST_RANGE_SECONDS', 10 * 60, int), None),
+    'MAX_WAIT_SECONDS': (lambda: settings.get('CLUSTER_READY_TIMEOUT_SECONDS') + settings.get('TEST_RANGE_SECONDS'),
+                         None),
+    # openshift binaries, shared by every version and run, see downloads.py
+    'DOWNLOAD_CACHE': (_env('CALIPER_DOWNLOAD_CACHE', path.join(REPO_ROOT, '_cache')), None),
+    # openshift-install and openshift-client tarballs are downloaded from <OCP_MIRROR>/<version>/. A file:// URL works
+    # too, e.g. for the stub binaries in hack/stubs
+    'OCP_MIRROR': (_env('CALIPER_OCP_MIRROR', 'https://mirror.openshift.com/pub/openshift-v4/clients/ocp'), None),
+    # clusters deployed at once when running several versions
+    'MAX_PARALLEL': (_env('CALIPER_MAX_PARALLEL', '2', int), None),
+    # also write each step's timing to the caliper_run_steps table, using the PG* settings in .env, see telemetry.py
+    'TELEMETRY_POSTGRES': (lambda: os.getenv('CALIPER_TELEMETRY_POSTGRES', '').lower() in ('1', 'true', 'yes'), None),
+    'HOST_PLATFORM': (get_platform, None),
+    'PROM_TOP_SOURCE': (verify_prom_top, _probe_ttl),
+    'DOTENV': (find_dotenv, _probe_ttl),
+})
+
+
+def __getattr__(name):
+    # module attributes, e.g. settings.HOST_PLATFORM, are resolved by settings
+    return settings.get(name)
@@ -0,0 +1,112 @@
+"""
+Where a run's wall-clock time goes: the start, end, duration, exit code and retries of every step a runner executes.
+
+Each version's steps are kept in a JSON run record, <work dir>/runs/<run id>.json, added to by each phase's runner
+process.  With CALIPER_TELEMETRY_POSTGRES set, every step is also written to the caliper_run_steps table, next to
+prom-top's metrics, for the plotter to chart by version.
+"""
+import json
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+
+table = 'caliper_run_steps'
+
+_ddl = f'''
+CREATE TABLE IF NOT EXISTS {table}
+(
+    run_id      text             NOT NULL,
+    version     text             NOT NULL,
+    step        text             NOT NULL,
+    started_at  timestamptz      NOT NULL,
+    finished_at timestamptz      NOT NULL,
+    seconds     double precision NOT NULL,
+    ok          boolean          NOT NULL,
+    returncode  int,
+    retries     int              NOT NULL DEFAULT 0,
+    detail      jsonb,
+    PRIMARY KEY (run_id, version, step)
+);
+'''
+
+_upsert = f'''
+INSERT INTO {table} (run_id, version, step, started_at, finished_at, seconds, ok, returncode, retries, detail)
+VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+ON CONFLICT (run_id, version, step) DO UPDATE SET
+    started_at = excluded.started_at, finished_at = excluded.finished_at, seconds = excluded.seconds,
+    ok = excluded.ok, returncode = excluded.returncode, retries = excluded.retries, detail = excluded.detail;
+'''
+
+
+def new_run_id():
+    # sorts by start time, and is unique across hosts
+    return f'{time.strftime("%Y%m%dT%H%M%S", time.gmtime())}-{uuid.uuid4().hex[:8]}'
+
+
+def _timestamp(seconds=0.0):
+    return datetime.fromtimestamp(seconds, timezone.utc).isoformat()
+
+
+class RunRecord:
+    """
+    The steps one run executed for a version.  add() saves the record after every step, so a runner that dies
+    mid-run leaves the steps it finished.  Steps skipped because an earlier run's checkpoint completed them are not
+    recorded again; their timings are in that run's record.
+    """
+
+    def __init__(self, work_dir='', version='', run_id='', postgres=False):
+        self.path = os.path.join(work_dir, 'runs', f'{run_id}.json')
+        self.version = version
+        self.run_id = run_id
+        self.postgres = postgres
+        self.steps = []
+        if os.path.exists(self.path):
+            with open(self.path, mode='r') as file:
+                self.steps = json.load(file).get('steps', [])
+
+    def add(self, step='', started=0.0, finished=0.0, ok=False, returncode=None, retries=0, detail=None):
+        entry = {
+            'step': step,
+            'started_at': _timestamp(started),
+            'finished_at': _timestamp(finished),
+            'seconds': round(finished - started, 3),
+            'ok': ok,
+            'returncode': returncode,
+            'retries': retries,
+            'detail': detail or {},
+        }
+        self.steps = [e for e in self.steps if e['step'] != step] + [entry]
+        self.save()
+        if self.postgres:
+            store(self.run_id, self.version, entry)
+        return entry
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = f'{self.path}.tmp'
+        with open(tmp, mode='w') as file:
+            json.dump({'run_id': self.run_id, 'version': self.version, 'steps': self.steps}, file, indent=2)
+        os.replace(tmp, self.path)
+
+
+def store(run_id='', version='', entry={}):
+    # best effort: a telemetry outage must never fail a run, whose JSON record has the same data
+    try:
+        import psycopg2
+    except ImportError:
+        print(f'psycopg2 is not installed, not writing {entry["step"]} timing to {table}')
+        return
+    try:
+        # connection settings come from the PG* variables in .env, as for prom-top
+        conn = psycopg2.connect('')
+        try:
+            with conn, conn.cursor() as cur:
+                cur.execute(_ddl)
+                cur.execute(_upsert, (run_id, version, entry['step'], entry['started_at'], entry['finished_at'],
+                                      entry['seconds'], entry['ok'], entry['returncode'], entry['retries'],
+                                      json.dumps(entry['detail'])))
+        finally:
+            conn.close()
+    except psycopg2.Error as e:
+        print(f'failed to write {entry["step"]} timing to {table}: {e}')
@@ -0,0 +1,128 @@
+import hashlib
+import io
+import os
+import tarfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import downloads
+
+
+def tarball(name='', content=b''):
+    data = io.BytesIO()
+    with tarfile.open(fileobj=data, mode='w:gz') as tar:
+        info = tarfile.TarInfo(name)
+        info.size = len(content)
+        info.mode = 0o755
+        tar.addfile(info, io.BytesIO(content))
+    return data.getvalue()
+
+
+class Mirror(BaseHTTPRequestHandler):
+    """
+    Serves files, honoring Range requests unless honor_range is off.  The first drops responses are cut off after
+    drop_after bytes, and every request's Range header is kept in ranges.
+    """
+    files = {}
+    honor_range = True
+    drops = 0
+    drop_after = 0
+    ranges = []
+
+    def do_GET(self):
+        data = self.files.get(self.path)
+        if data is None:
+            self.send_error(404)
+            return
+        requested = self.headers.get('Range')
+        self.ranges.append(requested)
+        start = 0
+        if requested and self.honor_range:
+            start = int(requested.split('=')[1].rstrip('-'))
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{len(data) - 1}/{len(data)}')
+        else:
+            self.send_response(200)
+        body = data[start:]
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if type(self).drops > 0:
+            type(self).drops -= 1
+            self.wfile.write(body[:self.drop_after])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+binary = os.urandom(256 * 1024)
+archive = tarball('oc', binary)
+sha256 = hashlib.sha256(archive).hexdigest()
+
+
+@pytest.fixture
+def mirror(monkeypatch):
+    handler = type('TestMirror', (Mirror,), {
+        'files': {'/oc.tar.gz': archive, '/sha256sum.txt': f'{sha256}  oc.tar.gz\n'.encode()},
+        'ranges': [],
+    })
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    # resumes back off for seconds
+    monkeypatch.setattr(downloads.time, 'sleep', lambda seconds: None)
+    yield handler, f'http://127.0.0.1:{server.server_port}'
+    server.shutdown()
+    server.server_close()
+
+
+def cached(cache_dir=''):
+    return sorted(os.path.relpath(os.path.join(d, f), cache_dir) for d, _, files in os.walk(cache_dir) for f in files)
+
+
+def test_fetch_all(mirror, tmp_path):
+    handler, url = mirror
+    paths = downloads.fetch_all({'oc': f'{url}/oc.tar.gz'}, str(tmp_path))
+    with open(paths['oc'], 'rb') as file:
+        assert file.read() == binary
+    assert cached(str(tmp_path)) == [os.path.join(sha256, 'oc')]
+    # a second fetch is served from the cache
+    assert downloads.fetch(f'{url}/oc.tar.gz', 'oc', str(tmp_path), sha256) == paths['oc']
+    assert handler.ranges == [None, None]
+
+
+def test_resumes_with_range(mirror, tmp_path):
+    handler, url = mirror
+    handler.drops, handler.drop_after = 2, 64 * 1024
+    path = downloads.fetch(f'{url}/oc.tar.gz', 'oc', str(tmp_path), sha256)
+    with open(path, 'rb') as file:
+        assert file.read() == binary
+    assert handler.ranges == [None, f'bytes={64 * 1024}-', f'bytes={128 * 1024}-']
+
+
+def test_resumes_when_range_ignored(mirror, tmp_path):
+    handler, url = mirror
+    handler.honor_range = False
+    handler.drops, handler.drop_after = 1, 100 * 1024
+    path = downloads.fetch(f'{url}/oc.tar.gz', 'oc', str(tmp_path), sha256)
+    with open(path, 'rb') as file:
+        assert file.read() == binary
+    assert handler.ranges == [None, f'bytes={100 * 1024}-']
+
+
+def test_checksum_mismatch(mirror, tmp_path):
+    _, url = mirror
+    with pytest.raises(downloads.ChecksumError):
+        downloads.fetch(f'{url}/oc.tar.gz', 'oc', str(tmp_path), '0' * 64)
+    assert cached(str(tmp_path)) == []
+
+
+def test_unreachable_leaves_nothing(tmp_path):
+    with pytest.raises(OSError):
+        downloads.fetch('http://127.0.0.1:1/oc.tar.gz', 'oc', str(tmp_path), sha256)
+    assert os.listdir(str(tmp_path)) == []
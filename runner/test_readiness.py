@@ -0,0 +1,62 @@
+import pytest
+
+import readiness
+
+
+def operators(*states):
+    # oc get clusteroperators -o json, one operator per (available, progressing, degraded)
+    items = []
+    for i, (available, progressing, degraded) in enumerate(states):
+        conditions = [{'type': t, 'status': str(v)} for t, v in
+                      [('Available', available), ('Progressing', progressing), ('Degraded', degraded)]]
+        items.append({'metadata': {'name': f'operator-{i}'}, 'status': {'conditions': conditions}})
+    return {'items': items}
+
+
+settled = operators((True, False, False), (True, False, False))
+progressing = operators((True, False, False), (True, True, False))
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def wait(timeline, window=100, timeout=1000, interval=10):
+    # timeline is [(from second, what poll() returns)], in order
+    clock = FakeClock()
+
+    def poll():
+        return [state for since, state in timeline if since <= clock.now][-1]
+
+    return readiness.wait_until_stable(poll, window, timeout, interval, clock=clock, sleep=clock.sleep,
+                                       log=lambda message: None)
+
+
+def test_unsettled():
+    assert readiness.unsettled(settled) == []
+    assert readiness.unsettled(progressing) == ['operator-1']
+    assert readiness.unsettled(operators((False, False, False), (True, False, True))) == ['operator-0', 'operator-1']
+
+
+def test_settles_after_window():
+    assert wait([(0, None), (30, progressing), (60, settled)]) == 160
+
+
+def test_flap_restarts_window():
+    assert wait([(0, settled), (50, progressing), (70, settled)]) == 170
+
+
+def test_no_operators_is_not_settled():
+    assert wait([(0, {'items': []}), (20, settled)]) == 120
+
+
+def test_timeout():
+    with pytest.raises(TimeoutError, match='operator-1'):
+        wait([(0, settled), (50, progressing)], timeout=300)